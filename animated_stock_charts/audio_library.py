@@ -0,0 +1,125 @@
+import os
+import json
+import random
+import subprocess
+import tempfile
+import wave
+import numpy as np
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+
+class AudioLibrary:
+    '''
+    Index of the background tracks in an audio folder, with their durations and decoded PCM cached on disk.
+
+    The index (track durations keyed by file size and modification time) is stored in cache_dir, so a
+    track is only probed again when its file changes. Each track is decoded to 16-bit PCM once and kept as
+    a .npy file that later runs and other processes memory-map. Trimmed and faded audio for a video is cut
+    straight from that PCM instead of decoding the MP3 again.
+    '''
+
+    def __init__(self, folder_path='./audio/', cache_dir='audio_cache', sample_rate=44100, channels=2):
+        self.folder_path = folder_path
+        self.cache_dir = cache_dir
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.index_file = os.path.join(cache_dir, 'audio_index.json')
+        self.index = None
+        self.pcm_tracks = {}
+
+    def build_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        old_index = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as f:
+                old_index = json.load(f)
+
+        index = {}
+        for name in sorted(os.listdir(self.folder_path)):
+            path = os.path.join(self.folder_path, name)
+            if not os.path.isfile(path):
+                continue
+
+            stat = os.stat(path)
+            entry = old_index.get(name)
+            if not entry or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+                entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'duration': ffmpeg_parse_infos(path)['duration']}
+            index[name] = entry
+
+        fd, tmp_filename = tempfile.mkstemp(suffix='.json', dir=self.cache_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_filename, self.index_file)
+
+        self.index = index
+        return index
+
+    def get_index(self):
+        if self.index is None:
+            self.build_index()
+        return self.index
+
+    def get_duration(self, audio_file):
+        return self.get_index()[os.path.basename(audio_file)]['duration']
+
+    def choose_track(self, min_duration=0):
+        '''Return the path of a random track at least min_duration seconds long, or None if there is none.'''
+        tracks = [name for name, entry in self.get_index().items() if entry['duration'] >= min_duration]
+        if not tracks:
+            return None
+        return os.path.join(self.folder_path, random.choice(tracks))
+
+    def get_pcm(self, audio_file):
+        '''Return the decoded track as an int16 array of shape (samples, channels).'''
+        name = os.path.basename(audio_file)
+        entry = self.get_index()[name]
+        pcm_filename = os.path.join(self.cache_dir, f"{name}.{entry['size']}.{int(entry['mtime'])}.npy")
+
+        if pcm_filename not in self.pcm_tracks:
+            if not os.path.exists(pcm_filename):
+                pcm = self.decode(os.path.join(self.folder_path, name))
+                fd, tmp_filename = tempfile.mkstemp(suffix='.npy', dir=self.cache_dir)
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, pcm)
+                os.replace(tmp_filename, pcm_filename)
+            self.pcm_tracks[pcm_filename] = np.load(pcm_filename, mmap_mode='r')
+
+        return self.pcm_tracks[pcm_filename]
+
+    def decode(self, path):
+        cmd = [get_setting("FFMPEG_BINARY"), '-loglevel', 'error', '-i', path, '-vn',
+               '-f', 's16le', '-acodec', 'pcm_s16le', '-ar', str(self.sample_rate), '-ac', str(self.channels), '-']
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise OSError(f"ffmpeg failed to decode {path}: {result.stderr.decode('utf-8', errors='replace')}")
+
+        return np.frombuffer(result.stdout, dtype=np.int16).reshape(-1, self.channels)
+
+    def write_faded_audio(self, audio_file, duration, fadeout_duration, filename, padding=0.1):
+        '''
+        Write the first `duration` seconds of the track to a WAV file, fading out linearly over the last
+        fadeout_duration seconds. `padding` seconds of silence are appended so probing the file never reports
+        it shorter than the video; the encoders cut the audio at the video length. Raises OSError if the
+        track is shorter than duration.
+        '''
+        pcm = self.get_pcm(audio_file)
+        sample_count = int(round(duration * self.sample_rate))
+        if len(pcm) < sample_count:
+            raise OSError(f"Audio file {audio_file} ({len(pcm) / self.sample_rate}s) is shorter than the video ({duration}s)")
+
+        audio = pcm[:sample_count].astype(np.float32)
+        fade_count = min(sample_count, int(round(fadeout_duration * self.sample_rate)))
+        if fade_count:
+            audio[-fade_count:] *= np.linspace(1, 0, fade_count, dtype=np.float32)[:, None]
+
+        audio = np.concatenate([audio, np.zeros((int(round(padding * self.sample_rate)), self.channels), dtype=np.float32)])
+
+        with wave.open(filename, 'wb') as f:
+            f.setnchannels(self.channels)
+            f.setsampwidth(2)
+            f.setframerate(self.sample_rate)
+            f.writeframes(audio.astype(np.int16).tobytes())
+
+        return filename
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+
+
+class BarSeries:
+    '''
+    OHLC(V) bars held as one contiguous numpy array per column, passed from the data stage to the renderers
+    instead of a DataFrame.
+
+    timestamps are int64 nanoseconds (UTC for tz-aware bars, wall time for naive ones, like DatetimeIndex.asi8),
+    prices default to float64 so legends and changes print exactly as they did from the DataFrame; float32
+    halves their size where that does not matter. Slicing with [:n] (or prefix(n)) returns a BarSeries of views
+    on the same arrays, so per-frame prefixes allocate no data. from_frame()/to_frame() convert at the edges.
+    '''
+
+    def __init__(self, timestamps, open, high, low, close, volume=None, tz=None, price_dtype=np.float64):
+        self.timestamps = np.ascontiguousarray(timestamps, dtype=np.int64)
+        self.open = np.ascontiguousarray(open, dtype=price_dtype)
+        self.high = np.ascontiguousarray(high, dtype=price_dtype)
+        self.low = np.ascontiguousarray(low, dtype=price_dtype)
+        self.close = np.ascontiguousarray(close, dtype=price_dtype)
+        self.volume = None if volume is None else np.ascontiguousarray(volume, dtype=np.int64)
+        self.tz = None if tz is None else str(tz)
+        self._index = None
+
+    @classmethod
+    def from_frame(cls, df, price_dtype=np.float64):
+        '''Build a BarSeries from a DataFrame indexed by time (or with a 'datetime' column) and OHLC(V) columns.'''
+        index = df.index if isinstance(df.index, pd.DatetimeIndex) else pd.DatetimeIndex(pd.to_datetime(df['datetime']))
+        volume = df['volume'].to_numpy() if 'volume' in df.columns else None
+        return cls(index.asi8, *[df[column].to_numpy() for column in PRICE_COLUMNS], volume=volume, tz=index.tz,
+                   price_dtype=price_dtype)
+
+    def to_frame(self):
+        columns = {column: getattr(self, column) for column in PRICE_COLUMNS}
+        if self.volume is not None:
+            columns['volume'] = self.volume
+        return pd.DataFrame(columns, index=self.index)
+
+    def save(self, path):
+        '''Write the arrays to an .npz file that load() reads back.'''
+        arrays = {column: getattr(self, column) for column in ('timestamps',) + PRICE_COLUMNS}
+        if self.volume is not None:
+            arrays['volume'] = self.volume
+        np.savez(path, tz=np.array(self.tz or ''), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            volume = arrays['volume'] if 'volume' in arrays.files else None
+            return cls(arrays['timestamps'], *[arrays[column] for column in PRICE_COLUMNS], volume=volume,
+                       tz=str(arrays['tz']) or None, price_dtype=arrays['open'].dtype)
+
+    @property
+    def index(self):
+        if self._index is None:
+            index = pd.DatetimeIndex(self.timestamps.view('datetime64[ns]'))
+            self._index = index if self.tz is None else index.tz_localize('UTC').tz_convert(self.tz)
+        return self._index
+
+    def ohlc(self):
+        '''Return the prices as one (bars, 4) array in open/high/low/close order.'''
+        return np.column_stack([self.open, self.high, self.low, self.close])
+
+    def prefix(self, count):
+        return self[:count]
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError("BarSeries only supports slicing")
+
+        bars = BarSeries.__new__(BarSeries)
+        bars.timestamps = self.timestamps[key]
+        bars.open, bars.high, bars.low, bars.close = self.open[key], self.high[key], self.low[key], self.close[key]
+        bars.volume = None if self.volume is None else self.volume[key]
+        bars.tz = self.tz
+        bars._index = None if self._index is None else self._index[key]
+        return bars
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getstate__(self):
+        # The index is rebuilt on demand, so worker processes are only sent the arrays
+        state = self.__dict__.copy()
+        state['_index'] = None
+        return state
+
+    @property
+    def nbytes(self):
+        arrays = [self.timestamps, self.open, self.high, self.low, self.close, self.volume]
+        return sum(array.nbytes for array in arrays if array is not None)
+
+
+def as_bar_series(bars):
+    return bars if isinstance(bars, BarSeries) else BarSeries.from_frame(bars)
@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+import numpy as np
+import pandas as pd
+from resampling import to_datetime_index
+
+# How long downloaded bars are served from the store before blast_off asks yfinance for newer ones
+FRESHNESS_SECONDS = {
+    '1m': 60,
+    '2m': 120,
+    '5m': 300,
+    '1d': 6 * 60 * 60,
+}
+DEFAULT_FRESHNESS_SECONDS = 15 * 60
+
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+class BarStore:
+    '''
+    Local SQLite store of the bars blast_off() downloads, keyed by symbol and interval.
+
+    Bars are stored as blast_off() formats them (duplicates and yfinance's bad 16:00 row already removed), so
+    cleanup happens once at ingest. For every symbol and interval the store remembers when it last downloaded
+    and from which date it holds complete data. A request is answered from the store alone while that download
+    is fresher than the interval's freshness window; otherwise only the bars from the day of the last stored
+    bar onwards are downloaded again, replacing the (possibly still forming) bars of that day.
+    '''
+
+    def __init__(self, path='market_data/bars.sqlite', freshness_seconds=None):
+        self.path = path
+        self.freshness_seconds = dict(FRESHNESS_SECONDS, **(freshness_seconds or {}))
+        self.initialized = False
+
+    def connect(self):
+        if not self.initialized:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self.initialized:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS bars (symbol TEXT, interval TEXT, timestamp INTEGER, open REAL, high REAL, '
+                         'low REAL, close REAL, volume INTEGER, PRIMARY KEY (symbol, interval, timestamp))')
+            conn.execute('CREATE TABLE IF NOT EXISTS downloads (symbol TEXT, interval TEXT, covered_from TEXT, tz TEXT, '
+                         'downloaded_at REAL, PRIMARY KEY (symbol, interval))')
+            conn.commit()
+            self.initialized = True
+        return conn
+
+    def get_download(self, symbol, interval):
+        with closing(self.connect()) as conn:
+            download = conn.execute('SELECT covered_from, tz, downloaded_at FROM downloads WHERE symbol = ? AND interval = ?',
+                                    (symbol, interval)).fetchone()
+            last_timestamp = conn.execute('SELECT MAX(timestamp) FROM bars WHERE symbol = ? AND interval = ?',
+                                          (symbol, interval)).fetchone()[0]
+        return download, last_timestamp
+
+    def plan_download(self, symbol, interval, start_date, now=None):
+        '''
+        Return the date to download `symbol` bars from so the store holds everything since start_date, or None
+        if the stored bars already do and are fresh.
+        '''
+        download, last_timestamp = self.get_download(symbol, interval)
+        if download is None or last_timestamp is None:
+            return start_date
+
+        covered_from, tz, downloaded_at = download
+        if start_date < covered_from:
+            return start_date
+
+        now = time.time() if now is None else now
+        if now - downloaded_at < self.freshness_seconds.get(interval, DEFAULT_FRESHNESS_SECONDS):
+            return None
+
+        last_bar = to_datetime_index(np.array([last_timestamp]), tz)[0]
+        return max(start_date, last_bar.strftime('%Y-%m-%d'))
+
+    def ingest(self, symbol, interval, data, download_start):
+        '''Store bars formatted by blast_off() that were downloaded from download_start.'''
+        index = pd.DatetimeIndex(pd.to_datetime(data['datetime']))
+        rows = zip([symbol] * len(data), [interval] * len(data), index.asi8.tolist(),
+                   *[data[column].astype(float if column != 'volume' else 'int64').tolist() for column in BAR_COLUMNS])
+
+        with closing(self.connect()) as conn, conn:
+            download = conn.execute('SELECT covered_from, tz FROM downloads WHERE symbol = ? AND interval = ?', (symbol, interval)).fetchone()
+            covered_from = min(download[0], download_start) if download else download_start
+            tz = str(index.tz) if index.tz is not None else None
+            if not len(data) and download:
+                tz = download[1]
+
+            # Everything from the download start is replaced, so bars that were still forming are updated.
+            # An empty download leaves the stored bars alone.
+            if len(data):
+                download_start_ns = local_date_to_timestamp(download_start, tz)
+                conn.execute('DELETE FROM bars WHERE symbol = ? AND interval = ? AND timestamp >= ?', (symbol, interval, download_start_ns))
+                conn.executemany('INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            conn.execute('INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?)', (symbol, interval, covered_from, tz, time.time()))
+
+    def read(self, symbol, interval, start_date):
+        '''Return the stored bars since start_date, formatted as blast_off() returns them.'''
+        with closing(self.connect()) as conn:
+            download = conn.execute('SELECT tz FROM downloads WHERE symbol = ? AND interval = ?', (symbol, interval)).fetchone()
+            tz = download[0] if download else None
+            data = pd.read_sql_query('SELECT timestamp, open, high, low, close, volume FROM bars WHERE symbol = ? AND interval = ? '
+                                     'AND timestamp >= ? ORDER BY timestamp', conn,
+                                     params=(symbol, interval, local_date_to_timestamp(start_date, tz)))
+
+        index = to_datetime_index(data.pop('timestamp').to_numpy(dtype=np.int64), tz).rename('timestamp')
+        data = data.set_axis(index, axis=0).astype({**dict.fromkeys(BAR_COLUMNS[:-1], float), 'volume': 'int64'})
+        data.insert(0, 'symbol', symbol.replace('-', '.'))
+        data.insert(0, 'datetime', index)
+        return data
+
+
+def local_date_to_timestamp(date, tz=None):
+    timestamp = pd.Timestamp(date)
+    return (timestamp if tz is None else timestamp.tz_localize(tz)).value
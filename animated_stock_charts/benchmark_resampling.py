@@ -0,0 +1,104 @@
+'''
+Benchmark the vectorized resampling in resampling.py against the previous per-day resample/append loop.
+
+    python benchmark_resampling.py
+
+Both versions run on the same synthetic 1-minute sessions (with a few missing minutes per day) and the
+results are checked to be identical before timing.
+'''
+import timeit
+import warnings
+import numpy as np
+import pandas as pd
+
+from resampling import resample_ohlc, resample_daily_ohlc
+
+LEGACY_RESAMPLE_RULES = {'open': 'first', 'high': max, 'low': min, 'close': 'last'}
+
+
+def append_rows(dataframe, rows):
+    # DataFrame.append() was removed in pandas 2.0; pd.concat() keeps the legacy loop runnable there
+    if hasattr(dataframe, 'append'):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', FutureWarning)
+            return dataframe.append(rows)
+    return pd.concat([dataframe, rows])
+
+
+def legacy_create_new_stock_timeframe(input_dataframe, output_mins_timeframe=30, resample_daily_data=False):
+    new_dataframe = pd.DataFrame(columns=input_dataframe.columns)
+    input_dataframe = input_dataframe.set_index(pd.to_datetime(input_dataframe['datetime']))
+
+    if resample_daily_data:
+        resampled = input_dataframe.resample(rule=f'{output_mins_timeframe}D').apply(LEGACY_RESAMPLE_RULES)
+        resampled.index += pd.to_timedelta((resampled.index.weekday == 5) * 2, unit='D')
+        resampled.index += pd.to_timedelta((resampled.index.weekday == 6) * 1, unit='D')
+        new_dataframe = append_rows(new_dataframe, resampled)
+    else:
+        for date_index, date_group in input_dataframe.groupby(pd.Grouper(freq='D')):
+            resampled = date_group.resample(rule=f'{output_mins_timeframe}min', origin='start').apply(LEGACY_RESAMPLE_RULES)
+            new_dataframe = append_rows(new_dataframe, resampled)
+
+    new_dataframe['datetime'] = new_dataframe.index
+    return new_dataframe
+
+
+def make_minute_bars(days, seed=0):
+    rng = np.random.default_rng(seed)
+    sessions = []
+    for day in pd.bdate_range('2023-01-02', periods=days):
+        index = pd.date_range(day + pd.Timedelta(hours=9, minutes=30), day + pd.Timedelta(hours=15, minutes=59), freq='1min')
+        sessions.append(index[rng.random(len(index)) > 0.02])
+    index = sessions[0].append(sessions[1:]).tz_localize('America/New_York')
+
+    close = 100 + np.cumsum(rng.normal(0, 0.05, len(index)))
+    return pd.DataFrame({'datetime': index, 'open': close + rng.normal(0, 0.02, len(index)),
+                         'high': close + 0.05, 'low': close - 0.05, 'close': close.round(2)})
+
+
+def make_daily_bars(days, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, days))
+    return pd.DataFrame({'datetime': pd.bdate_range('2000-01-03', periods=days), 'open': close + rng.normal(0, 0.5, days),
+                         'high': close + 1, 'low': close - 1, 'close': close})
+
+
+def check_same_bars(legacy, vectorized):
+    assert legacy.index.equals(vectorized.index)
+    np.testing.assert_allclose(legacy[['open', 'high', 'low', 'close']].astype(float).to_numpy(),
+                               vectorized[['open', 'high', 'low', 'close']].to_numpy())
+
+
+def benchmark(name, legacy, vectorized, repeat=3):
+    check_same_bars(legacy(), vectorized())
+    legacy_time = min(timeit.repeat(legacy, number=1, repeat=repeat))
+    vectorized_time = min(timeit.repeat(vectorized, number=1, repeat=repeat))
+    print(f"{name:<32} legacy {legacy_time * 1000:9.1f} ms   vectorized {vectorized_time * 1000:8.1f} ms   "
+          f"{legacy_time / vectorized_time:6.1f}x")
+
+
+def main():
+    for days in (1, 5, 20, 60):
+        minute_bars = make_minute_bars(days)
+        benchmark(f"{days} days of 1m -> 2m",
+                  lambda: legacy_create_new_stock_timeframe(minute_bars, output_mins_timeframe=2),
+                  lambda: resample_ohlc(minute_bars, '2min'))
+
+    for days in (253, 2520):
+        daily_bars = make_daily_bars(days)
+        benchmark(f"{days} daily bars -> 2D",
+                  lambda: legacy_create_new_stock_timeframe(daily_bars, output_mins_timeframe=2, resample_daily_data=True),
+                  lambda: resample_daily_ohlc(daily_bars, days=2))
+
+    symbols = ['GME', 'SPY', 'TSLA', 'AAPL', 'NET', 'META', 'MSFT', 'NFLX', 'AMZN', 'NVDA', 'QQQ', 'GOOG', 'PLTR']
+    symbol_bars = [make_minute_bars(5, seed=seed).assign(symbol=symbol) for seed, symbol in enumerate(symbols)]
+    all_symbol_bars = pd.concat(symbol_bars, ignore_index=True)
+    benchmark_multi_symbol = min(timeit.repeat(lambda: resample_ohlc(all_symbol_bars, '2min', group_column='symbol'), number=1, repeat=3))
+    legacy_multi_symbol = min(timeit.repeat(lambda: [legacy_create_new_stock_timeframe(bars.drop(columns='symbol'), 2) for bars in symbol_bars],
+                                            number=1, repeat=3))
+    print(f"{'13 symbols x 5 days, 1m -> 2m':<32} legacy {legacy_multi_symbol * 1000:9.1f} ms   "
+          f"vectorized {benchmark_multi_symbol * 1000:8.1f} ms   {legacy_multi_symbol / benchmark_multi_symbol:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
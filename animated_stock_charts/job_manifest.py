@@ -0,0 +1,108 @@
+import os
+import json
+import shutil
+import sqlite3
+import time
+import datetime
+from contextlib import closing
+
+# The stages of a chart job, in the order they complete
+JOB_STAGES = ('fetched', 'rendered', 'encoded', 'described', 'recorded')
+
+
+class JobManifest:
+    '''
+    SQLite manifest of how far every chart job got, so a rerun picks a failed job up where it stopped.
+
+    A job is one symbol of one chart run on one day. For every job the manifest keeps the last stage it
+    completed (see JOB_STAGES) and named artifacts: paths of files kept in the job's directory under jobs_dir,
+    the number of frames rendered so far, the encoded video of every profile, the OpenAI description. Artifacts
+    are stored as JSON. Job directories are removed once the job is recorded; the manifest rows stay.
+    '''
+
+    def __init__(self, path='jobs/manifest.sqlite', jobs_dir='jobs'):
+        self.path = path
+        self.jobs_dir = jobs_dir
+        self.initialized = False
+
+    def connect(self):
+        if not self.initialized:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self.initialized:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, stage TEXT, updated_at REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS artifacts (job_id TEXT, name TEXT, value TEXT, PRIMARY KEY (job_id, name))')
+            conn.commit()
+            self.initialized = True
+        return conn
+
+    def checkpoint(self, chart_run, symbol, date=None):
+        date = date or datetime.date.today()
+        return JobCheckpoint(self, f"{date}_{chart_run}_{symbol}")
+
+    def get_stage(self, job_id):
+        with closing(self.connect()) as conn:
+            row = conn.execute('SELECT stage FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_stage(self, job_id, stage):
+        with closing(self.connect()) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)', (job_id, stage, time.time()))
+
+    def get_artifact(self, job_id, name, default=None):
+        with closing(self.connect()) as conn:
+            row = conn.execute('SELECT value FROM artifacts WHERE job_id = ? AND name = ?', (job_id, name)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def put_artifacts(self, job_id, artifacts):
+        with closing(self.connect()) as conn, conn:
+            conn.executemany('INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?)',
+                             [(job_id, name, json.dumps(value)) for name, value in artifacts.items()])
+
+    def prune_job_dirs(self, date=None):
+        '''Remove the directories left behind by jobs of earlier days, which a rerun today will not resume.'''
+        prefix = f"{date or datetime.date.today()}_"
+        if not os.path.isdir(self.jobs_dir):
+            return
+        for name in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, name)
+            if os.path.isdir(path) and not name.startswith(prefix):
+                shutil.rmtree(path, ignore_errors=True)
+
+
+class JobCheckpoint:
+    '''One job's view of a JobManifest, with the directory its files are kept in between attempts.'''
+
+    def __init__(self, manifest, job_id):
+        self.manifest = manifest
+        self.job_id = job_id
+        self.job_dir = os.path.join(manifest.jobs_dir, job_id)
+
+    @property
+    def stage(self):
+        return self.manifest.get_stage(self.job_id)
+
+    def reached(self, stage):
+        current = self.stage
+        return current is not None and JOB_STAGES.index(current) >= JOB_STAGES.index(stage)
+
+    def complete(self, stage, **artifacts):
+        '''Record artifacts and mark stage as completed (a stage never moves the job backwards).'''
+        if artifacts:
+            self.put(**artifacts)
+        if not self.reached(stage):
+            self.manifest.set_stage(self.job_id, stage)
+
+    def get(self, name, default=None):
+        return self.manifest.get_artifact(self.job_id, name, default)
+
+    def put(self, **artifacts):
+        self.manifest.put_artifacts(self.job_id, artifacts)
+
+    def path(self, filename):
+        os.makedirs(self.job_dir, exist_ok=True)
+        return os.path.join(self.job_dir, filename)
+
+    def remove_files(self):
+        shutil.rmtree(self.job_dir, ignore_errors=True)
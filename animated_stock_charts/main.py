@@ -1,72 +1,171 @@
 import matplotlib.pyplot as plt
 import pandas as pd
 import mplfinance as mpf
+import numpy as np
 import datetime
 import os
 import glob
-import random
 from moviepy.editor import *
 from PIL import Image, ImageDraw
 import gc
+import io
 from moviepy.editor import ImageClip, concatenate_videoclips, AudioFileClip
 from moviepy.video.fx import fadeout
-from moviepy.audio.fx import audio_fadeout as afx
 import platform
+import shutil
+import tempfile
+import time
+import threading
+from contextlib import contextmanager
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from mplfinance._helpers import _determine_format_string
+from mplfinance._widths import _widths, _dfinterpolate
+
+from video_encoder import write_video_with_ffmpeg, write_video_in_segments, get_visible_entries, merge_identical_entries, fit_frame, load_frame
+from raster_renderer import RasterCandlestickRenderer
+from job_manifest import JobManifest
+from pipeline import Stage, run_pipeline
+from bar_series import BarSeries, as_bar_series
+from bar_store import BarStore
+from resampling import IntradayAggregator
+from market_sessions import get_session_times
+from yfinance_data import blast_off_many
+from audio_library import AudioLibrary
+from variables import get_stock_data_to_plot, get_intraday_market_data, get_sql_market_data, log, create_animated_text_videos_db, \
+insert_video_record, get_openai_video_description, delete_video_and_record_if_uploaded, market_day, get_prev_closes, BAR_STORE
+
+# Output video formats. Frames are rendered once per video and fitted to every requested profile.
+OUTPUT_PROFILES = {
+    'square': (1080, 1080),  # Instagram
+    'vertical': (1080, 1920),  # TikTok
+}
+DEFAULT_OUTPUT_PROFILE = 'square'
+
+VIDEO_FPS = 24
+# Seconds each candlestick frame is shown, per output_filename_marker
+CANDLESTICK_FRAME_DURATIONS = {
+    'intraday': 0.13,
+    'quarterly': 0.16,
+    'six_months': 0.15,
+    'yearly': 0.09,
+}
+INTRO_DURATIONS = (0.5, 1, 1.6)  # The third intro image fades out over its last 0.5 seconds
+FINAL_IMAGE_DURATION = 2
+
+AUDIO_FADEOUT_DURATION = 1.5
+# A job's rendered frames are counted in its checkpoint once per this many frames
+FRAMES_PER_CHECKPOINT = 48
+# Background tracks, indexed once with their durations; decoded audio is cached in audio_cache/
+AUDIO_LIBRARY = AudioLibrary(folder_path='./audio/', cache_dir='audio_cache')
+
+
+class IntroCardRenderer:
+    '''
+    Renders the three intro cards on one reusable matplotlib figure.
+
+    The first card ("Stock Replay / in seconds") is the same for every symbol and is saved once per date.
+    For each symbol the symbol, period and date texts are added on top of the shared layer, the second
+    (only if filename2 is given) and third cards are saved, and the texts are removed again. The subplot
+    layout is reset before every symbol so each card comes out exactly like a freshly built figure would.
+    '''
+
+    def __init__(self, font='sans-serif'):
+        self.font = font
+        self.fig, self.ax = plt.subplots(figsize=(10.8, 10.8))
+        self.ax.axis('off')
+
+        # Increased the y-coordinate for more top margin
+        self.ax.text(0.5, 0.75, "Stock Replay", ha='center', va='center',
+                     fontdict={'family': 'cursive', 'color': 'darkblue', 'weight': 'bold', 'size': 40})
+        self.ax.text(0.5, 0.65, "in seconds", ha='center', va='center',
+                     fontdict={'family': 'cursive', 'color': 'darkblue', 'weight': 'normal', 'size': 30})
+
+        self.fig.tight_layout()
+        self.base_layout = {name: getattr(self.fig.subplotpars, name) for name in ('left', 'bottom', 'right', 'top', 'wspace', 'hspace')}
+
+    def save_base_card(self, filename):
+        self.fig.subplots_adjust(**self.base_layout)
+        save_figure_atomically(self.fig, filename, dpi=180)
+
+    def save_symbol_cards(self, symbol, second_image_text, current_date, filename2, filename3):
+        self.fig.subplots_adjust(**self.base_layout)
+        symbol_texts = [self.ax.text(0.5, 0.55, symbol, ha='center', va='center',
+                                     fontdict={'family': self.font, 'color': 'black', 'weight': 'bold', 'size': 40})]
 
-from variables import get_most_recent_close, get_stock_data_to_plot, log, create_animated_text_videos_db, \
-insert_video_record, get_openai_video_description, delete_video_and_record_if_uploaded, market_day
-
-
-def save_intro_images(symbol=None, second_image_text=None, font='sans-serif'):
-    if not os.path.exists('temp_images'):
-        os.makedirs('temp_images')
-
+        try:
+            self.fig.tight_layout()
+            if filename2:
+                save_figure_atomically(self.fig, filename2, dpi=180)
+
+            symbol_texts.append(self.ax.text(0.5, 0.45, f"{'INTRADAY' if not second_image_text else second_image_text}", ha='center', va='center',
+                                             fontdict={'family': 'cursive', 'color': 'red', 'weight': 'bold', 'size': 30}))
+            symbol_texts.append(self.ax.text(0.5, 0.35, current_date, ha='center', va='center',
+                                             fontdict={'family': 'cursive', 'color': 'black', 'weight': 'normal', 'size': 20}))
+            save_figure_atomically(self.fig, filename3, dpi=180)
+        finally:
+            for text in symbol_texts:
+                text.remove()
+
+
+def save_figure_atomically(fig, filename, **savefig_kwargs):
+    # Other symbol jobs may read the cached card while it's written, so write to a temp file and rename it into place
+    fd, tmp_filename = tempfile.mkstemp(suffix='.png', dir=os.path.dirname(filename))
+    os.close(fd)
+    try:
+        fig.savefig(tmp_filename, **savefig_kwargs)
+        os.replace(tmp_filename, filename)
+    finally:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+
+# Each process keeps its intro card figures, one per font
+_intro_card_renderers = {}
+
+
+def prune_intro_cache(cache_dir, current_date_dir):
+    # Cards are only ever reused on the day they were made
+    for entry in glob.glob(os.path.join(cache_dir, '*')):
+        if os.path.isdir(entry) and os.path.abspath(entry) != os.path.abspath(current_date_dir):
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def save_intro_images(symbol=None, second_image_text=None, font='sans-serif', cache_dir='intro_cache'):
+    # Intro cards are cached per (symbol, period, date) under cache_dir/<date>/ and shared by every run and job.
+    # The returned files must be treated as read-only.
     if not symbol:
         raise ValueError("Symbol needs to be specified in save_intro_images()")
 
-    fig, ax = plt.subplots(figsize=(10.8, 10.8))
-    ax.axis('off')
-
-    # Dynamic date
-    current_date = datetime.datetime.now().strftime("%A %B %d, %Y")
+    now = datetime.datetime.now()
+    current_date = now.strftime("%A %B %d, %Y")
+    date_dir = os.path.join(cache_dir, now.strftime("%Y-%m-%d"))
+    if not os.path.exists(date_dir):
+        os.makedirs(date_dir, exist_ok=True)
+        prune_intro_cache(cache_dir, date_dir)
 
-    # Increased the y-coordinate for more top margin
-    ax.text(0.5, 0.75, "Stock Replay", ha='center', va='center',
-            fontdict={'family': 'cursive', 'color': 'darkblue', 'weight': 'bold', 'size': 40})
-    ax.text(0.5, 0.65, "in seconds", ha='center', va='center',
-            fontdict={'family': 'cursive', 'color': 'darkblue', 'weight': 'normal', 'size': 30})
+    period = (second_image_text or 'INTRADAY').replace(' ', '_')
+    font_marker = '' if font == 'sans-serif' else f"_{font}"
+    filename1 = os.path.join(date_dir, "temp_intro_image1.png")
+    filename2 = os.path.join(date_dir, f"temp_intro_image2_{symbol}{font_marker}.png")
+    filename3 = os.path.join(date_dir, f"temp_intro_image3_{symbol}_{period}{font_marker}.png")
 
-    plt.tight_layout()
-    filename1 = "temp_images/temp_intro_image1.png"
-    plt.savefig(filename1, dpi=180)
+    if all(os.path.exists(filename) for filename in (filename1, filename2, filename3)):
+        return filename1, filename2, filename3
 
-    ax.text(0.5, 0.55, symbol, ha='center', va='center',
-            fontdict={'family': font, 'color': 'black', 'weight': 'bold', 'size': 40})
+    if font not in _intro_card_renderers:
+        _intro_card_renderers[font] = IntroCardRenderer(font=font)
+    intro_card_renderer = _intro_card_renderers[font]
 
-    plt.tight_layout()
-    filename2 = "temp_images/temp_intro_image2.png"
-    plt.savefig(filename2, dpi=180)
-
-    ax.text(0.5, 0.45, f"{'INTRADAY' if not second_image_text else second_image_text}", ha='center', va='center',
-            fontdict={'family': 'cursive', 'color': 'red', 'weight': 'bold', 'size': 30})
-    ax.text(0.5, 0.35, current_date, ha='center', va='center',
-            fontdict={'family': 'cursive', 'color': 'black', 'weight': 'normal', 'size': 20})
-
-    filename3 = "temp_images/temp_intro_image3.png"
-    plt.savefig(filename3, dpi=180)
-
-    gc.collect()
+    if not os.path.exists(filename1):
+        intro_card_renderer.save_base_card(filename1)
+    intro_card_renderer.save_symbol_cards(symbol, second_image_text, current_date,
+                                          None if os.path.exists(filename2) else filename2, filename3)
 
     return filename1, filename2, filename3
 
 
-def save_candlestick_image(df, index, is_last_image=False, prev_close=None, chart_title=None):
-    if not os.path.exists('temp_images'):
-        os.makedirs('temp_images')
-
-    if not chart_title:
-        raise ValueError("Symbol needs to be specified in save_candlestick_image()")
-
+def get_candlestick_frame_values(df, prev_close=None):
     if prev_close:
         # Ensure gain_loss_color is either 'green' or 'red'
         percentage_change = round(
@@ -91,173 +190,830 @@ def save_candlestick_image(df, index, is_last_image=False, prev_close=None, char
     if gain_loss_color not in ['green', 'red']:
         raise ValueError("gain_loss_color must be either 'green' or 'red'")
 
-    # Convert 'Datetime' from string to datetime object
-    # df['datetime'] = pd.to_datetime(df['datetime'])
-    # df.set_index('datetime', inplace=True)
-
-    # Style and plot settings
-    style = mpf.make_mpf_style(base_mpf_style='yahoo', y_on_right=True)
-
     if prev_close:
         # Adjust ylim
         y_min = min(df['low'].min(), prev_close) - 0.5
         y_max = max(df['high'].max(), prev_close) + 0.5
-
-        # Create horizontal line data for prev_close without the label argument
-        hline_data = [prev_close] * len(df)
-        ap = [mpf.make_addplot(hline_data, color='navy')]  # Updated color to navy
-
+        hline_value = prev_close
     else:
         # Adjust ylim
         y_min = df['low'].min() - 4
         y_max = df['high'].max() + 4
+        hline_value = df['close'].iloc[0]
+
+    last_date = df.index[-1]
+    formatted_date = last_date.strftime('%A %B %d, %Y') if prev_close else last_date.strftime('%B %d, %Y')
+
+    return {
+        'percentage_change': percentage_change,
+        'value_change': value_change,
+        'gain_loss_color': gain_loss_color,
+        'y_min': y_min,
+        'y_max': y_max,
+        'hline_value': hline_value,
+        'formatted_date': formatted_date,
+        'legend_labels': [
+            f"Close: {df['close'].iloc[-1]}",
+            f'Previous Day Close: {prev_close}' if prev_close else f"Start Day: {df['close'].iloc[0]}",
+            f'Change: {value_change}',
+            f'Daily Gain/Loss: {percentage_change}%',
+        ],
+    }
+
+
+def precompute_frame_values(bars, prev_close=None):
+    # Vectorized version of get_candlestick_frame_values() for every prefix df.iloc[:i + 1] at once:
+    # running min/max for the y-limits, changes and colours from the close column, and the legend/xlabel
+    # strings. Returns one dict per frame with the same keys and values. Takes a BarSeries or a DataFrame.
+    bars = as_bar_series(bars)
+    closes = bars.close
+    # fmin/fmax skip the NaN rows of empty bins (halts, missing minutes) like the pandas min()/max() they replace
+    running_low = np.fmin.accumulate(bars.low)
+    running_high = np.fmax.accumulate(bars.high)
+
+    if prev_close:
+        reference_close = prev_close
+        percentage_changes = np.round(((closes - prev_close) / prev_close) * 100, 2)
+        value_changes = np.round(closes - prev_close, 2)
+        y_mins = np.minimum(running_low, prev_close) - 0.5
+        y_maxs = np.maximum(running_high, prev_close) + 0.5
+        reference_label = f'Previous Day Close: {prev_close}'
+        formatted_dates = bars.index.strftime('%A %B %d, %Y')
+    else:
+        reference_close = closes[0]
+        percentage_changes = np.round(((closes - closes[0]) / closes[0]) * 100, 2)
+        value_changes = np.round(closes - closes[0], 2)
+        y_mins = running_low - 4
+        y_maxs = running_high + 4
+        reference_label = f"Start Day: {closes[0]}"
+        formatted_dates = bars.index.strftime('%B %d, %Y')
+
+    gain_loss_colors = np.where(percentage_changes > 0, 'green', 'red')
+
+    return [
+        {
+            'percentage_change': percentage_changes[i],
+            'value_change': value_changes[i],
+            'gain_loss_color': str(gain_loss_colors[i]),
+            'y_min': y_mins[i],
+            'y_max': y_maxs[i],
+            'hline_value': reference_close,
+            'formatted_date': formatted_dates[i],
+            'legend_labels': [
+                f"Close: {closes[i]}",
+                reference_label,
+                f'Change: {value_changes[i]}',
+                f'Daily Gain/Loss: {percentage_changes[i]}%',
+            ],
+        }
+        for i in range(len(bars))
+    ]
+
+
+def draw_last_image_line(img, dpi=180):
+    draw = ImageDraw.Draw(img)
+
+    # Determine the location for the vertical line. Here, we draw the line near the right edge.
+    # Adjust the values if needed.
+    width, height = img.size
+    line_x = width - int(115 * dpi / 180)  # 115 pixels from the right edge at dpi=180
+    line_start = 0
+    line_end = height
+
+    # Draw the vertical line on the image
+    draw.line([(line_x, line_start), (line_x, line_end)], fill='black', width=2)
+
+    return img
+
+
+def get_tight_bbox(fig):
+    # The bbox (in inches) savefig(bbox_inches='tight') crops the figure to
+    return fig.get_tightbbox(fig.canvas.get_renderer()).padded(plt.rcParams['savefig.pad_inches'])
+
+
+def figure_to_array(fig, dpi=180):
+    # Same output as fig.savefig(..., bbox_inches='tight') but rasterized into a raw RGBA buffer,
+    # which skips the PNG encode and the decode that follows it.
+    fig.set_dpi(dpi)
+    bbox = get_tight_bbox(fig)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='rgba', dpi=dpi, bbox_inches=bbox)
+
+    width = int(bbox.width * dpi)
+    return np.frombuffer(buffer.getvalue(), dtype=np.uint8).reshape(-1, width, 4)[:, :, :3]
+
+
+def fit_figure_to_tight_bbox(fig):
+    # Resize the figure to its tight bbox and move the axes to match, which is what savefig(bbox_inches='tight')
+    # does temporarily. Blitting works on the canvas buffer, so the labels that stick out of the figure
+    # have to be brought inside it.
+    bbox = get_tight_bbox(fig)
+    old_width, old_height = fig.get_size_inches()
+
+    positions = [ax.get_position().bounds for ax in fig.axes]
+    fig.set_size_inches(bbox.width, bbox.height)
+
+    for ax, (x0, y0, width, height) in zip(fig.axes, positions):
+        ax.set_position([(x0 * old_width - bbox.x0) / bbox.width,
+                         (y0 * old_height - bbox.y0) / bbox.height,
+                         width * old_width / bbox.width,
+                         height * old_height / bbox.height])
+
+
+def finish_frame_array(frame, is_last_image=False, side=1080, dpi=180):
+    # In-memory equivalent of the last-image line plus fitting the frame rendered at `dpi` to a chart square of `side`.
+    # A frame rendered at the chart side (see get_profile_dpi()) is only padded; larger ones are resized.
+    img = Image.fromarray(frame)
+
+    if is_last_image:
+        draw_last_image_line(img, dpi=dpi)
+
+    return np.asarray(fit_frame(img, (side, side)))
+
+
+def get_chart_side(output_sizes):
+    # Charts are square and as large as the shorter side of the output size (see fit_frame())
+    return max(min(size) for size in output_sizes)
+
+
+def get_profile_dpi(fig, output_sizes):
+    # The dpi at which the figure's tight bbox rasterizes to the chart side of the largest output profile, so the
+    # frame only needs padding to the profile size instead of a resample. Rounded down so it never comes out larger.
+    bbox = get_tight_bbox(fig)
+    return int(get_chart_side(output_sizes) / max(bbox.width, bbox.height) * 100) / 100
 
-        # Create horizontal line data for prev_close without the label argument
-        hline_data = [df['close'].iloc[0]] * len(df)
-        ap = [mpf.make_addplot(hline_data, color='navy')]  # Updated color to navy
+
+def save_candlestick_image(df, index, is_last_image=False, prev_close=None, chart_title=None, temp_dir='temp_images'):
+    if not os.path.exists(temp_dir):
+        os.makedirs(temp_dir)
+
+    if not chart_title:
+        raise ValueError("Symbol needs to be specified in save_candlestick_image()")
+
+    values = get_candlestick_frame_values(df, prev_close)
+    percentage_change = values['percentage_change']
+
+    # Convert 'Datetime' from string to datetime object
+    # df['datetime'] = pd.to_datetime(df['datetime'])
+    # df.set_index('datetime', inplace=True)
+
+    # Style and plot settings
+    style = mpf.make_mpf_style(base_mpf_style='yahoo', y_on_right=True)
+
+    # Create horizontal line data for prev_close without the label argument
+    hline_data = [values['hline_value']] * len(df)
+    ap = [mpf.make_addplot(hline_data, color='navy')]  # Updated color to navy
 
     fig, axes = mpf.plot(df, type='candle', style=style, addplot=ap, returnfig=True,
                          ylabel='Price',
-                         ylim=(y_min, y_max),
+                         ylim=(values['y_min'], values['y_max']),
                          figsize=(10.8, 10.8),
                          tight_layout=True)
 
     # Set the main title and the subtitle for the chart
     axes[0].set_title(chart_title, fontsize=16, horizontalalignment='center', pad=20, fontdict={'family': 'cursive'})
 
-    last_date = df.index[-1]
-    formatted_date = last_date.strftime('%A %B %d, %Y') if prev_close else last_date.strftime('%B %d, %Y')
-    axes[0].set_xlabel(formatted_date, fontsize=12, horizontalalignment='center', labelpad=10, fontdict={'family': 'cursive'})
+    axes[0].set_xlabel(values['formatted_date'], fontsize=12, horizontalalignment='center', labelpad=10, fontdict={'family': 'cursive'})
 
     # Manually add a legend for the Previous Day Close
+    add_candlestick_legend(axes[0], values)
+
+    # Save the modified figure with unique filename
+    filename = os.path.join(temp_dir, f"temp_candlestick_image_{index}.png")
+    fig.savefig(filename, dpi=180, bbox_inches='tight')
+
+    if is_last_image:
+        # Load the saved image using PIL and save it again with the line drawn on it
+        draw_last_image_line(Image.open(filename)).save(filename)
+
+    plt.close()
+    gc.collect()
+
+    return filename, percentage_change
+
+
+def add_candlestick_legend(ax, values):
+    current_close_label, prev_close_label, value_change_label, percentage_change_label = values['legend_labels']
+    gain_loss_color = values['gain_loss_color']
+
     current_close_patch = plt.Line2D([0], [0], marker='o', color='#aaaaaa', markerfacecolor='#aaaaaa', markersize=10,
-                                       label=f"Close: {df['close'].iloc[-1]}")
+                                       label=current_close_label)
     prev_close_patch = plt.Line2D([0], [0], marker='o', color='navy', markerfacecolor='navy', markersize=10,
-                                  label=f'Previous Day Close: {prev_close}' if prev_close else f"Start Day: {df['close'].iloc[0]}")
+                                  label=prev_close_label)
     gain_loss_difference_patch = plt.Line2D([0], [0], marker='o', color=gain_loss_color, markerfacecolor=gain_loss_color, markersize=10,
-                                       label=f'Change: {value_change}')
+                                       label=value_change_label)
     daily_gain_loss_patch = plt.Line2D([0], [0], marker='o', color=gain_loss_color, markerfacecolor=gain_loss_color, markersize=10,
-                                       label=f'Daily Gain/Loss: {percentage_change}%')
+                                       label=percentage_change_label)
 
-    legend = axes[0].legend(handles=[current_close_patch, prev_close_patch, gain_loss_difference_patch, daily_gain_loss_patch], loc='upper left')  # Changed order and added daily_gain_loss_patch
+    legend = ax.legend(handles=[current_close_patch, prev_close_patch, gain_loss_difference_patch, daily_gain_loss_patch], loc='upper left')  # Changed order and added daily_gain_loss_patch
     legend.get_texts()[2].set_color(gain_loss_color)
     legend.get_texts()[3].set_color(gain_loss_color)
     legend.get_texts()[2].set_weight('bold')
     legend.get_texts()[3].set_weight('bold')
 
-    # Save the modified figure with unique filename
-    filename = f"temp_images/temp_candlestick_image_{index}.png"
-    fig.savefig(filename, dpi=180, bbox_inches='tight')
+    return legend
+
+
+class IncrementalCandlestickRenderer:
+    '''
+    Renders every frame of one candlestick replay on a single mplfinance figure.
+
+    The style, figure, axes, title, legend and prev-close line are created once per video from the
+    full series of bars. Each render() call then reveals one more candle and updates the axis limits,
+    legend and xlabel, so frame i matches what save_candlestick_image() draws for df.iloc[:i + 1].
+    '''
+
+    def __init__(self, bars, prev_close=None, chart_title=None, output_sizes=None, temp_dir='temp_images'):
+        if not os.path.exists(temp_dir):
+            os.makedirs(temp_dir)
+
+        if not chart_title:
+            raise ValueError("Symbol needs to be specified in IncrementalCandlestickRenderer()")
+
+        self.bars = as_bar_series(bars)
+        self.output_sizes = output_sizes
+        self.temp_dir = temp_dir
+        self.frame_values = precompute_frame_values(self.bars, prev_close)
+
+        values = self.frame_values[-1]
+        style = mpf.make_mpf_style(base_mpf_style='yahoo', y_on_right=True)
+        ap = [mpf.make_addplot([values['hline_value']] * len(self.bars), color='navy')]
+
+        # mplfinance only takes DataFrames, so the bars are converted once for the whole video
+        self.fig, axes = mpf.plot(self.bars.to_frame(), type='candle', style=style, addplot=ap, returnfig=True,
+                                  ylabel='Price',
+                                  ylim=(values['y_min'], values['y_max']),
+                                  figsize=(10.8, 10.8),
+                                  tight_layout=True)
+        self.ax = axes[0]
+        self.ax.set_title(chart_title, fontsize=16, horizontalalignment='center', pad=20, fontdict={'family': 'cursive'})
+
+        # mplfinance adds the wicks (LineCollection) and then the bodies (PolyCollection) for all candles,
+        # followed by the prev-close addplot line. Each frame only shows a prefix of them.
+        self.wicks, self.bodies = self.ax.collections[0], self.ax.collections[1]
+        self.hline = self.ax.lines[0]
+        self.formatter = self.ax.xaxis.get_major_formatter()
+        self.dates = self.formatter.dates
+
+        self.body_facecolors = self.bodies.get_facecolors()
+        self.body_edgecolors = self.bodies.get_edgecolors()
+        self.wick_colors = self.wicks.get_colors()
+
+        opens = self.bars.open.astype(float, copy=False)
+        closes = self.bars.close.astype(float, copy=False)
+        highs = self.bars.high.astype(float, copy=False)
+        lows = self.bars.low.astype(float, copy=False)
+        self.opens = opens
+        self.closes = closes
+        xdates = np.arange(len(self.bars), dtype=float)
+        self.wick_lows = np.stack([np.column_stack([xdates, lows]), np.column_stack([xdates, np.minimum(opens, closes)])], axis=1)
+        self.wick_highs = np.stack([np.column_stack([xdates, highs]), np.column_stack([xdates, np.maximum(opens, closes)])], axis=1)
+
+        self.legend = add_candlestick_legend(self.ax, values)
+
+    def render(self, index, is_last_image=False, in_memory=False):
+        # In-memory frames are one chart square at the chart side of output_sizes, which encode_video() pads to every profile
+        values = self.update_frame(index)
+
+        if in_memory:
+            output_sizes = self.output_sizes or [(1080, 1080)]
+            dpi = get_profile_dpi(self.fig, output_sizes)
+            frame = finish_frame_array(figure_to_array(self.fig, dpi=dpi), is_last_image, get_chart_side(output_sizes), dpi=dpi)
+            return frame, values['percentage_change']
+
+        filename = os.path.join(self.temp_dir, f"temp_candlestick_image_{index}.png")
+        self.fig.savefig(filename, dpi=180, bbox_inches='tight')
+
+        if is_last_image:
+            draw_last_image_line(Image.open(filename)).save(filename)
+
+        return filename, values['percentage_change']
+
+    def set_candles(self, count, width_count=None):
+        # Show the first `count` candles, sized the way mplfinance sizes them in a plot of `width_count` candles
+        width_count = width_count or count
+        xdates = np.arange(count, dtype=float)
+        candle_width = _dfinterpolate(_widths, width_count, 'cw')
+        candle_linewidth = _dfinterpolate(_widths, width_count, 'clw')
+        delta = candle_width / 2.0
+
+        body_verts = np.empty((count, 4, 2))
+        body_verts[:, :, 0] = xdates[:, None] + np.array([-delta, -delta, delta, delta])
+        body_verts[:, :, 1] = np.column_stack([self.opens[:count], self.closes[:count], self.closes[:count], self.opens[:count]])
+        self.bodies.set_verts(body_verts)
+        self.bodies.set_facecolor(self.body_facecolors[:count])
+        self.bodies.set_edgecolor(self.body_edgecolors[:count])
+        self.bodies.set_linewidth(candle_linewidth)
+
+        self.wicks.set_segments(np.concatenate([self.wick_lows[:count], self.wick_highs[:count]]))
+        self.wicks.set_color(self.wick_colors[:count])
+        self.wicks.set_linewidth(candle_linewidth)
+
+    def update_frame(self, index):
+        # Update every artist to what save_candlestick_image() would draw for df.iloc[:index + 1]
+        count = index + 1
+        values = self.frame_values[index]
+        xdates = np.arange(count, dtype=float)
+
+        # Candle/line widths and x-limits follow mplfinance's rules for a plot of `count` candles
+        self.set_candles(count)
+
+        self.hline.set_data(xdates, [values['hline_value']] * count)
+        self.hline.set_linewidth(1.6 * _dfinterpolate(_widths, count, 'lw'))
+
+        avg_dist_between_points = (xdates[-1] - xdates[0]) / float(count)
+        min_x = xdates[0] - (0.45 * avg_dist_between_points)
+        max_x = xdates[-1] + (0.45 * avg_dist_between_points)
+        if count == 1:
+            min_x = min_x - 0.75
+            max_x = max_x + 0.75
+        self.ax.set_xlim(min_x, max_x)
+        self.ax.set_ylim(values['y_min'], values['y_max'])
+
+        self.formatter.fmt = _determine_format_string(self.dates[:count])
+        self.formatter.len = count
+
+        self.ax.set_xlabel(values['formatted_date'], fontsize=12, horizontalalignment='center', labelpad=10, fontdict={'family': 'cursive'})
+        self.update_legend(values)
+
+        return values
+
+    def update_legend(self, values):
+        gain_loss_color = values['gain_loss_color']
+        legend_handles = getattr(self.legend, 'legend_handles', None) or self.legend.legendHandles
+
+        for text, label in zip(self.legend.get_texts(), values['legend_labels']):
+            text.set_text(label)
+
+        for position in (2, 3):
+            legend_handles[position].set_color(gain_loss_color)
+            legend_handles[position].set_markerfacecolor(gain_loss_color)
+            self.legend.get_texts()[position].set_color(gain_loss_color)
+
+    def close(self):
+        plt.close(self.fig)
+        gc.collect()
 
-    if is_last_image:
-        # Load the saved image using PIL
-        img = Image.open(filename)
-        draw = ImageDraw.Draw(img)
 
-        # Determine the location for the vertical line. Here, we draw the line near the right edge.
-        # Adjust the values if needed.
-        width, height = img.size
-        line_x = width - 115  # 115 pixels from the right edge
-        line_start = 0
-        line_end = height
+class BlitCandlestickRenderer(IncrementalCandlestickRenderer):
+    '''
+    Renders a candlestick replay by blitting onto a cached background.
 
-        # Draw the vertical line on the image
-        draw.line([(line_x, line_start), (line_x, line_end)], fill='black', width=2)
+    The axes are laid out once for the final frame: x/y limits, ticks, grid, title and ylabel stay fixed and
+    the candles fill in from left to right, instead of the chart re-scaling every frame like the other
+    renderers do. Everything static is rasterized once; each frame restores that background and draws
+    only the candles, the prev-close line, the legend and the xlabel on top of it.
+    '''
 
-        # Save the modified image
-        img.save(filename)
+    def __init__(self, bars, prev_close=None, chart_title=None, output_sizes=None, temp_dir='temp_images'):
+        super().__init__(bars, prev_close=prev_close, chart_title=chart_title, output_sizes=output_sizes, temp_dir=temp_dir)
 
-    plt.close()
-    gc.collect()
+        self.update_frame(len(self.bars) - 1)
+        self.fig.set_dpi(180)
+        fit_figure_to_tight_bbox(self.fig)
 
-    return filename, percentage_change
+        # The figure is now its tight bbox, so its canvas can be rasterized right at the chart side and no frame is resampled
+        self.chart_side = get_chart_side(output_sizes or [(1080, 1080)])
+        self.dpi = int(self.chart_side / max(self.fig.get_size_inches()) * 100) / 100
+        self.fig.set_dpi(self.dpi)
 
+        self.animated_artists = [self.wicks, self.bodies, self.hline, self.legend, self.ax.xaxis.label]
+        for artist in self.animated_artists:
+            artist.set_animated(True)
 
-def resize_image(img_path, target_size=(1080, 1080)):
-    with Image.open(img_path) as img:
-        img = img.resize(target_size, Image.LANCZOS) if platform.system() == "Linux" else img.resize(target_size, Image.ANTIALIAS)
-        img.save(img_path)
+        # Axis.draw() always draws its label, so blank it out of the background and draw it per frame
+        self.ax.xaxis.label.set_text('')
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
 
+    def render(self, index, is_last_image=False, in_memory=False):
+        count = index + 1
+        values = self.frame_values[index]
 
-def get_audio_filename():
-    folder_path = "./audio/"
-    files = [f for f in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, f))]
-    if not files:
-        return None  # or handle empty folder differently if you prefer
-    selected_file = random.choice(files)
-    return f"{folder_path + selected_file}"
+        self.set_candles(count, width_count=len(self.bars))
+        self.ax.xaxis.label.set_text(values['formatted_date'])
+        self.update_legend(values)
 
+        self.fig.canvas.restore_region(self.background)
+        for artist in self.animated_artists:
+            self.ax.draw_artist(artist)
 
-def create_video(symbol, image_list, audio_file=None, output_filename_marker=None, symbol_daily_change=None):
-    if output_filename_marker == 'intraday':
-        duration_of_candlestick_charts = 0.13
-    elif output_filename_marker == 'quarterly':
-        duration_of_candlestick_charts = 0.16
-    elif output_filename_marker == 'six_months':
-        duration_of_candlestick_charts = 0.15
-    elif output_filename_marker == 'yearly':
-        duration_of_candlestick_charts = 0.09
-    else:
-        raise ValueError("create_video() needs an output_filename input")
+        # A copy, as the next restore_region() overwrites the canvas buffer
+        frame = np.ascontiguousarray(np.asarray(self.fig.canvas.buffer_rgba())[:, :, :3])
 
-    log("Starting process to create video")
-    # Resize images to ensure they have the same size
-    for img_path in image_list:
-        resize_image(img_path)
-
-    intro_duration1 = 0.5  # Duration for the first intro image
-    intro_duration2 = 1  # Duration for the second intro image
-    intro_duration3 = 1.6  # Duration for the third intro image (with fade-out)
-    final_image_duration = 2
-    clips = []
+        frame = finish_frame_array(frame, is_last_image, self.chart_side, dpi=self.dpi)
 
-    # First intro image without fade-out
-    clips.append(ImageClip(image_list[0]).set_duration(intro_duration1))
+        if in_memory:
+            return frame, values['percentage_change']
 
-    # Second intro image without fade-out
-    clips.append(ImageClip(image_list[1]).set_duration(intro_duration2))
+        filename = os.path.join(self.temp_dir, f"temp_candlestick_image_{index}.png")
+        Image.fromarray(frame).save(filename)
 
-    # Third intro image with fade-out
-    clips.append(
-        ImageClip(image_list[2]).set_duration(intro_duration3).fx(fadeout.fadeout, 0.5))
+        return filename, values['percentage_change']
 
-    for filename in image_list[3:-1]:  # All images except the intro images and the last image
-        clip = ImageClip(filename, duration=duration_of_candlestick_charts)
-        clips.append(clip)
-        clip.close()
 
-    clips.append(ImageClip(image_list[-1], duration=final_image_duration))
-    clips[-1].close()
+def make_raster_renderer(bars, prev_close=None, chart_title=None, output_sizes=None, temp_dir='temp_images'):
+    if not os.path.exists(temp_dir):
+        os.makedirs(temp_dir)
 
-    video = concatenate_videoclips(clips, method="compose")
+    bars = as_bar_series(bars)
+    frame_values = precompute_frame_values(bars, prev_close)
+    side = get_chart_side(output_sizes or [(1080, 1080)])
+    return RasterCandlestickRenderer(bars, frame_values, chart_title=chart_title, size=(side, side), temp_dir=temp_dir)
 
-    log("Adding audio to the file")
-    audio = AudioFileClip(audio_file).subclip(0, video.duration)
-    audio_with_fadeout = audio.fx(afx.audio_fadeout, duration=1.5)  # Fading out last 3 seconds
-    final_audio = audio_with_fadeout.subclip(0, video.duration)
-    video = video.set_audio(final_audio)
 
-    log("Exporting final video")
-    video_filename_no_directory = f"{symbol}_stock_replay_{output_filename_marker}_{datetime.datetime.now().date()}.mp4"
-    video_filename = f'/var/www/html/members.managed.capital/stock_videos/{video_filename_no_directory}' if platform.system() == "Linux" else video_filename_no_directory
+CANDLESTICK_RENDERERS = {
+    'incremental': IncrementalCandlestickRenderer,
+    'blit': BlitCandlestickRenderer,
+    'raster': make_raster_renderer,
+}
+
+# Each render worker process keeps its own renderer (and matplotlib figure)
+_worker_renderer = None
+
+
+def init_render_worker(bars, prev_close, chart_title, renderer='incremental', output_sizes=None, temp_dir='temp_images'):
+    global _worker_renderer
+    _worker_renderer = CANDLESTICK_RENDERERS[renderer](bars, prev_close=prev_close, chart_title=chart_title, output_sizes=output_sizes,
+                                                       temp_dir=temp_dir)
+
+
+def render_frame_chunk(indices, last_index, in_memory=False):
+    log(f"Making images {indices[0] + 1} to {indices[-1] + 1} of {last_index + 1}")
+    return [_worker_renderer.render(i, i == last_index, in_memory=in_memory) for i in indices]
+
+
+def render_candlestick_images(bars, chart_title, prev_close=None, in_memory=False, workers=1, renderer='incremental',
+                              output_profiles=None, frame_indices=None, temp_dir='temp_images', previous_images=None, on_frame=None):
+    # `bars` is a BarSeries (a DataFrame is converted once). With in_memory=True the frames are returned as RGB arrays of the
+    # chart square instead of PNG paths in temp_dir. `renderer` is one of CANDLESTICK_RENDERERS.
+    # With output_profiles (names from OUTPUT_PROFILES) the result is a dict of frame lists per profile. Every profile
+    # shares the same frames (in memory, rendered at the chart side of the largest profile) and encode_video() fits
+    # them to each one. frame_indices limits rendering to those candle counts (minus one),
+    # e.g. the ones picked by schedule_candlestick_frames().
+    # previous_images ({index: frame as rendered}) are frames an earlier attempt already has, and on_frame(index, frame)
+    # is called with every frame as it is rendered, in order (see render_job_frames()).
+    if renderer not in CANDLESTICK_RENDERERS:
+        raise ValueError(f"Unknown candlestick renderer: {renderer}")
+
+    bars = as_bar_series(bars)
+    output_sizes = [OUTPUT_PROFILES[profile] for profile in output_profiles] if output_profiles and in_memory else None
+    if frame_indices is None:
+        frame_indices = range(len(bars))
+    frame_indices = list(frame_indices)
+
+    previous_images = previous_images or {}
+    # An index listed more than once is rendered once and its entries share the frame (see merge_identical_entries())
+    render_indices = [i for i in dict.fromkeys(frame_indices) if i not in previous_images]
+    images = []
+    percentage_change = None
+
+    if workers > 1 and len(render_indices) > 1:
+        images, percentage_change = render_candlestick_images_parallel(bars, chart_title, prev_close=prev_close, in_memory=in_memory,
+                                                                       workers=workers, renderer=renderer, output_sizes=output_sizes,
+                                                                       frame_indices=render_indices, temp_dir=temp_dir, on_frame=on_frame)
+    elif render_indices:
+        frame_renderer = CANDLESTICK_RENDERERS[renderer](bars, prev_close=prev_close, chart_title=chart_title, output_sizes=output_sizes,
+                                                         temp_dir=temp_dir)
+
+        try:
+            for i in render_indices:
+                log(f"Making image {i + 1} of {len(bars)}")
+                is_last_image = i == len(bars) - 1
+                img, percentage_change = frame_renderer.render(i, is_last_image, in_memory=in_memory)
+                images.append(img)
+                if on_frame is not None:
+                    on_frame(i, img)
+        finally:
+            frame_renderer.close()
+
+    if len(render_indices) < len(frame_indices):
+        rendered_images = dict(zip(render_indices, images))
+        images = [previous_images[i] if i in previous_images else rendered_images[i] for i in frame_indices]
+        percentage_change = precompute_frame_values(bars, prev_close)[frame_indices[-1]]['percentage_change']
+
+    if not output_profiles:
+        return images, percentage_change
+
+    return {profile: images for profile in output_profiles}, percentage_change
+
+
+def render_candlestick_images_parallel(bars, chart_title, prev_close=None, in_memory=False, workers=4, chunks_per_worker=4,
+                                       renderer='incremental', output_sizes=None, frame_indices=None, temp_dir='temp_images', on_frame=None):
+    # Split the frame indices into contiguous chunks so each worker mostly renders neighbouring frames,
+    # and use several chunks per worker so a slow chunk doesn't leave the other workers idle.
+    # executor.map() yields the chunks in submission order, so the frames come back in order.
+    bars = as_bar_series(bars)
+    last_index = len(bars) - 1
+    if frame_indices is None:
+        frame_indices = list(range(len(bars)))
+    chunk_size = max(1, -(-len(frame_indices) // (workers * chunks_per_worker)))
+    chunks = [frame_indices[start:start + chunk_size] for start in range(0, len(frame_indices), chunk_size)]
+
+    images = []
+    percentage_change = None
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_render_worker,
+                             initargs=(bars, prev_close, chart_title, renderer, output_sizes, temp_dir)) as executor:
+        for chunk, rendered_chunk in zip(chunks, executor.map(render_frame_chunk, chunks, [last_index] * len(chunks), [in_memory] * len(chunks))):
+            for i, (img, percentage_change) in zip(chunk, rendered_chunk):
+                images.append(img)
+                if on_frame is not None:
+                    on_frame(i, img)
+
+    return images, percentage_change
+
+
+def get_audio_filename(min_duration=0):
+    # Random track that is at least min_duration seconds long. Without one the video would come out silent
+    # (ffmpeg encoders) or fail deep inside moviepy, so that is an error here.
+    audio_file = AUDIO_LIBRARY.choose_track(min_duration)
+    if audio_file is None:
+        log(f"No audio track in {AUDIO_LIBRARY.folder_path} is at least {min_duration:.1f} seconds long")
+        raise ValueError(f"No audio track is long enough for a {min_duration:.1f} second video")
+    return audio_file
+
+
+def get_candle_durations(output_filename_marker, candle_count):
+    return [CANDLESTICK_FRAME_DURATIONS[output_filename_marker]] * (candle_count - 1) + [FINAL_IMAGE_DURATION]
+
+
+def get_video_duration(candle_durations):
+    return sum(INTRO_DURATIONS) + sum(candle_durations)
+
+
+def schedule_candlestick_frames(candle_count, output_filename_marker, fps=VIDEO_FPS, target_duration=None):
+    # Work out the video timeline before rendering and return (candle index, duration) for every candle
+    # that ends up in an output frame. Candles that would fall between two output frames aren't rendered.
+    # With target_duration (seconds) the candle duration is stretched or squeezed so the video fits it.
+    # Every CANDLESTICK_FRAME_DURATIONS entry lasts at least two output frames, so without a target_duration
+    # short enough to put several candles in one frame every candle is scheduled and nothing is skipped.
+    if output_filename_marker not in CANDLESTICK_FRAME_DURATIONS:
+        raise ValueError("schedule_candlestick_frames() needs an output_filename input")
+
+    candle_duration = CANDLESTICK_FRAME_DURATIONS[output_filename_marker]
+    if target_duration and candle_count > 1:
+        candle_duration = max(0, target_duration - sum(INTRO_DURATIONS) - FINAL_IMAGE_DURATION) / (candle_count - 1)
+
+    durations = list(INTRO_DURATIONS) + [candle_duration] * (candle_count - 1) + [FINAL_IMAGE_DURATION]
+    intro_count = len(INTRO_DURATIONS)
+    schedule = [(index - intro_count, duration) for index, duration in get_visible_entries(durations, fps=fps) if index >= intro_count]
+
+    log(f"Scheduled {len(schedule)} of {candle_count} candlestick frames")
+    return schedule
 
-    video.write_videofile(video_filename, fps=24)
 
+def get_video_path(video_filename):
+    return f'/var/www/html/members.managed.capital/stock_videos/{video_filename}' if platform.system() == "Linux" else video_filename
+
+
+def encode_video(symbol, image_list, audio_file=None, output_filename_marker=None, encoder='moviepy', output_profile=DEFAULT_OUTPUT_PROFILE,
+                 candle_durations=None, encode_workers=None):
+    # Encode the intro and candlestick images into the profile's video and return its filename (without the directory).
+    # candle_durations optionally gives the duration of every candlestick image (see schedule_candlestick_frames()).
+    # encode_workers is the number of segment processes for encoder='ffmpeg_segments' (all CPUs by default).
+    if output_filename_marker not in CANDLESTICK_FRAME_DURATIONS:
+        raise ValueError("encode_video() needs an output_filename_marker input")
+    if encoder not in ('moviepy', 'ffmpeg', 'ffmpeg_segments'):
+        raise ValueError(f"Unknown video encoder: {encoder}")
+
+    if candle_durations is None:
+        candle_durations = get_candle_durations(output_filename_marker, len(image_list) - 3)
+
+    log("Starting process to create video")
+    # Every image (intro card, PNG frame or in-memory chart square) is fitted to the profile size as it is encoded
+    frame_size = OUTPUT_PROFILES[output_profile]
+
+    # (image, duration, fade-out duration) for every image, in playback order
+    timeline = [
+        (image_list[0], INTRO_DURATIONS[0], 0),  # First intro image without fade-out
+        (image_list[1], INTRO_DURATIONS[1], 0),  # Second intro image without fade-out
+        (image_list[2], INTRO_DURATIONS[2], 0.5),  # Third intro image with fade-out
+    ]
+    for filename, duration in zip(image_list[3:], candle_durations):
+        timeline.append((filename, duration, 0))
+
+    # Runs of entries showing the same frame (an index listed more than once) are encoded as one longer entry
+    merged_timeline = merge_identical_entries(timeline)
+    log(f"Merged {len(timeline)} timeline entries into {len(merged_timeline)}")
+    timeline = merged_timeline
+
+    profile_marker = '' if output_profile == DEFAULT_OUTPUT_PROFILE else f"_{output_profile}"
+    video_filename_no_directory = f"{symbol}_stock_replay_{output_filename_marker}{profile_marker}_{datetime.datetime.now().date()}.mp4"
+    video_filename = get_video_path(video_filename_no_directory)
+
+    # Every encoder gets the audio already trimmed and faded from the decoded-track cache
+    audio_dir = tempfile.mkdtemp(prefix='audio_')
+    try:
+        if audio_file:
+            audio_file = AUDIO_LIBRARY.write_faded_audio(audio_file, get_video_duration(candle_durations), AUDIO_FADEOUT_DURATION,
+                                                         os.path.join(audio_dir, 'audio.wav'))
+
+        if encoder == 'ffmpeg':
+            log("Exporting final video with ffmpeg")
+            write_video_with_ffmpeg(timeline, video_filename, audio_file=audio_file, fps=VIDEO_FPS, audio_fadeout_duration=0,
+                                    frame_size=frame_size)
+        elif encoder == 'ffmpeg_segments':
+            log("Exporting final video with ffmpeg in parallel segments")
+            write_video_in_segments(timeline, video_filename, audio_file=audio_file, fps=VIDEO_FPS, audio_fadeout_duration=0,
+                                    frame_size=frame_size, workers=encode_workers)
+        else:
+            write_video_with_moviepy(timeline, video_filename, audio_file=audio_file, fps=VIDEO_FPS, frame_size=frame_size)
+    finally:
+        shutil.rmtree(audio_dir, ignore_errors=True)
+
+    return video_filename_no_directory
+
+
+def get_video_description(symbol, symbol_daily_change=None):
     print(f'{datetime.datetime.now()} Starting to create video description, sending to OpenAI')
     video_description = get_openai_video_description(symbol=symbol, daily_change=f'{symbol_daily_change}')
     print(f'{datetime.datetime.now()} video_description created = {video_description}')
 
-    video_description = video_description.replace('"', '')
-    insert_video_record(date=datetime.datetime.now().today(), symbol=symbol, filename=video_filename_no_directory, video_description=video_description)
+    return video_description.replace('"', '')
+
+
+def record_video(symbol, video_filename, video_description):
+    insert_video_record(date=datetime.datetime.now().today(), symbol=symbol, filename=video_filename, video_description=video_description)
     print(f'{datetime.datetime.now()} Video successfully created')
 
 
+def create_profile_videos(symbol, intro_images, frames_by_profile, output_filename_marker, symbol_daily_change=None, encoder='moviepy',
+                          candle_durations=None, checkpoint=None, encode_workers=None):
+    # One video per output profile. The OpenAI description is requested once and reused for every profile.
+    # Only tracks that are long enough for the video are picked. With a JobCheckpoint, videos encoded, the
+    # description received and records inserted by an earlier attempt of the job are not done again.
+    video_filenames = encode_profile_videos(symbol, intro_images, frames_by_profile, output_filename_marker, encoder=encoder,
+                                            candle_durations=candle_durations, checkpoint=checkpoint, encode_workers=encode_workers)
+    video_description = describe_videos(symbol, symbol_daily_change, checkpoint=checkpoint)
+    record_videos(symbol, video_filenames, video_description, checkpoint=checkpoint)
+
+
+def encode_profile_videos(symbol, intro_images, frames_by_profile, output_filename_marker, encoder='moviepy', candle_durations=None,
+                          checkpoint=None, encode_workers=None):
+    # Encode one video per output profile and return {profile: video filename}
+    video_filenames = {}
+    for output_profile, candlestick_images in frames_by_profile.items():
+        video_filename = checkpoint.get(f'video_{output_profile}') if checkpoint else None
+        if video_filename and os.path.exists(get_video_path(video_filename)):
+            log(f"Reusing {video_filename} encoded by an earlier attempt")
+            video_filenames[output_profile] = video_filename
+            continue
+
+        images = list(intro_images) + candlestick_images
+        video_duration = get_video_duration(candle_durations or get_candle_durations(output_filename_marker, len(candlestick_images)))
+
+        # Only tracks at least as long as the video are picked, so the audio never runs out
+        audio_file = get_audio_filename(min_duration=video_duration)
+        log(f"audio_file = {audio_file}")
+        video_filename = encode_video(symbol, images, output_filename_marker=output_filename_marker, audio_file=audio_file, encoder=encoder,
+                                      output_profile=output_profile, candle_durations=candle_durations, encode_workers=encode_workers)
+
+        video_filenames[output_profile] = video_filename
+        if checkpoint:
+            checkpoint.put(**{f'video_{output_profile}': video_filename})
+
+    if checkpoint:
+        checkpoint.complete('encoded')
+    return video_filenames
+
+
+def describe_videos(symbol, symbol_daily_change=None, checkpoint=None):
+    video_description = checkpoint.get('description') if checkpoint else None
+    if video_description is None:
+        video_description = get_video_description(symbol, symbol_daily_change)
+        if checkpoint:
+            checkpoint.complete('described', description=video_description)
+    return video_description
+
+
+def record_videos(symbol, video_filenames, video_description, checkpoint=None):
+    for output_profile, video_filename in video_filenames.items():
+        if checkpoint and checkpoint.get(f'recorded_{output_profile}'):
+            continue
+        record_video(symbol, video_filename, video_description)
+        if checkpoint:
+            checkpoint.put(**{f'recorded_{output_profile}': True})
+
+    if checkpoint:
+        # The job is done, its bars and frames are not needed for another attempt
+        checkpoint.complete('recorded')
+        checkpoint.remove_files()
+
+
+def get_job_checkpoint(manifest, chart_run, symbol):
+    return manifest.checkpoint(chart_run, symbol) if manifest is not None else None
+
+
+def get_job_bars(checkpoint, get_bars):
+    # get_bars() returns (bars, prev_close). With a checkpoint they are saved with the job, so a rerun renders
+    # the same bars again (and reuses the frames it already rendered from them) instead of fetching newer ones.
+    if checkpoint and checkpoint.reached('fetched') and os.path.exists(checkpoint.get('bars', '')):
+        log(f"Resuming {checkpoint.job_id} at stage {checkpoint.stage}")
+        return BarSeries.load(checkpoint.get('bars')), checkpoint.get('prev_close')
+
+    bars, prev_close = get_bars()
+    if checkpoint:
+        bars_filename = checkpoint.path('bars.npz')
+        bars.save(bars_filename)
+        checkpoint.complete('fetched', bars=bars_filename, prev_close=None if prev_close is None else float(prev_close))
+    return bars, prev_close
+
+
+def render_job_frames(bars, chart_title, checkpoint=None, frame_indices=None, **render_kwargs):
+    # render_candlestick_images() for a job. With a checkpoint every frame is kept in the job's directory as it is
+    # rendered and frames_rendered is updated every FRAMES_PER_CHECKPOINT frames, so a rerun only renders the frames
+    # after those. PNG frames are rendered straight into that directory; in-memory frames are saved as PNG chart squares.
+    # The raster renderer draws a frame about as fast as it loads, so its in-memory frames are not kept.
+    if checkpoint is None:
+        return render_candlestick_images(bars, chart_title, frame_indices=frame_indices, **render_kwargs)
+
+    output_profiles = render_kwargs.get('output_profiles')
+    if output_profiles and checkpoint.reached('encoded') and all(
+            os.path.exists(get_video_path(checkpoint.get(f'video_{profile}', ''))) for profile in output_profiles):
+        # Every video is encoded already, so the frames are not loaded again
+        return dict.fromkeys(output_profiles), checkpoint.get('percentage_change')
+
+    if frame_indices is None:
+        frame_indices = range(len(bars))
+    frame_indices = list(frame_indices)
+    in_memory = render_kwargs.get('in_memory', False)
+    keep_frames = not (in_memory and render_kwargs.get('renderer', 'incremental') == 'raster')
+
+    frames_dir = checkpoint.path('frames')
+    os.makedirs(frames_dir, exist_ok=True)
+    if not in_memory:
+        render_kwargs['temp_dir'] = frames_dir
+
+    def frame_path(i):
+        return os.path.join(frames_dir, f"chart_{i}.png" if in_memory else f"temp_candlestick_image_{i}.png")
+
+    def load_frame_as_rendered(i):
+        return load_frame(frame_path(i)) if in_memory else frame_path(i)
+
+    # Frames are rendered in order, so frames_rendered counts a prefix of frame_indices
+    frames_rendered = checkpoint.get('frames_rendered', 0) if keep_frames else 0
+    previous_images = {i: load_frame_as_rendered(i) for i in frame_indices[:frames_rendered] if os.path.exists(frame_path(i))}
+    if previous_images:
+        log(f"Reusing {len(previous_images)} of {len(frame_indices)} frames rendered by an earlier attempt")
+    positions = {i: position for position, i in enumerate(frame_indices, 1)}
+    checkpointed = frames_rendered
+
+    def save_frame(i, img):
+        nonlocal checkpointed
+        if in_memory:
+            # Written atomically, as it is resumed from. The lowest compression level keeps saving cheap and still
+            # shrinks the mostly white charts to a fraction of their raw size.
+            Image.fromarray(img).save(frame_path(i) + '.tmp', format='PNG', compress_level=1)
+            os.replace(frame_path(i) + '.tmp', frame_path(i))
+        if positions[i] - checkpointed >= FRAMES_PER_CHECKPOINT:
+            checkpoint.put(frames_rendered=positions[i])
+            checkpointed = positions[i]
+
+    # Frames are saved in order on one writer thread, so compressing them overlaps with rendering the next ones.
+    # Leaving the with block waits for every frame handed to it, also when rendering fails.
+    saves = []
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        on_frame = (lambda i, img: saves.append(writer.submit(save_frame, i, img))) if keep_frames else None
+        images, percentage_change = render_candlestick_images(bars, chart_title, frame_indices=frame_indices, previous_images=previous_images,
+                                                              on_frame=on_frame, **render_kwargs)
+    for save in saves:
+        save.result()
+    artifacts = {'frames_rendered': len(frame_indices)} if keep_frames else {}
+    checkpoint.complete('rendered', percentage_change=None if percentage_change is None else float(percentage_change), **artifacts)
+    return images, percentage_change
+
+
+def write_video_with_moviepy(timeline, video_filename, audio_file=None, fps=24, frame_size=None):
+    clips = []
+
+    for image, duration, fadeout_duration in timeline:
+        clip = ImageClip(load_frame(image, frame_size)).set_duration(duration)
+        if fadeout_duration:
+            clip = clip.fx(fadeout.fadeout, fadeout_duration)
+        clips.append(clip)
+
+    video = concatenate_videoclips(clips, method="compose")
+
+    if audio_file:
+        # The audio comes trimmed and faded out already (see AudioLibrary.write_faded_audio())
+        log("Adding audio to the file")
+        video = video.set_audio(AudioFileClip(audio_file).subclip(0, video.duration))
+
+    log("Exporting final video")
+    video.write_videofile(video_filename, fps=fps)
+
+
 def clean_temp_files():
     # Remove all files in /temp folder
     temp_files = glob.glob('./temp_images/*')
     for f in temp_files:
         try:
-            os.remove(f)
+            if os.path.isdir(f):
+                shutil.rmtree(f)
+            else:
+                os.remove(f)
         except Exception as e:
             print(f"Error deleting {f}: {e}")
 
@@ -271,109 +1027,368 @@ def clean_temp_files():
                 print(f"Error deleting {video}: {e}")
 
 
-def run_intraday_charts(symbols):
-    for symbol in symbols:
-        df = get_stock_data_to_plot(symbol, use_yfinance_data=True, period_to_chart='1m')
-        prev_close = get_most_recent_close(symbol, days_back=1)
-        intro_images = save_intro_images(symbol=symbol)
-        images = list(intro_images)
-
-        for i in range(len(df)):
-            log(f"Making image {i} of {len(df)}")
-            subset_df = df.iloc[:i + 1].copy()
-            is_last_image = i == len(df) - 1
-            img, percentage_change = save_candlestick_image(subset_df, i, is_last_image, prev_close=prev_close, chart_title=f"{symbol} Intraday Action")
-            images.append(img)
-
+# How every chart run gets its bars (period_to_chart and get_stock_data_to_plot() arguments) and titles its charts.
+# The run's name is also its output filename marker.
+CHART_RUN_SETTINGS = {
+    'intraday': dict(period_to_chart='1m', data_kwargs=dict(use_yfinance_data=True), title='Intraday Action', second_image_text=None,
+                     label='INTRADAY', describe_change=True),
+    'quarterly': dict(period_to_chart='quarter', data_kwargs=dict(only_get_most_recent_day=False), title='Last 3 Months',
+                      second_image_text='LAST 3 MONTHS', label='QUARTERLY', describe_change=False),
+    'six_months': dict(period_to_chart='six_months', data_kwargs=dict(only_get_most_recent_day=False), title='Last 6 Months',
+                       second_image_text='LAST 6 MONTHS', label='SIX MONTHS', describe_change=False),
+    'yearly': dict(period_to_chart='year', data_kwargs=dict(only_get_most_recent_day=False), title='Last 12 Months',
+                   second_image_text='LAST 12 MONTHS', label='YEARLY', describe_change=False),
+}
+
+
+def get_chart_market_data(chart_run, symbols):
+    # Intraday bars come from yfinance in one batched request, daily bars from SQL in one query
+    if chart_run == 'intraday':
+        return get_intraday_market_data(symbols)
+    return get_sql_market_data(symbols, CHART_RUN_SETTINGS[chart_run]['period_to_chart'])
+
+
+class BatchedMarketData:
+    '''
+    Read-only {symbol: data} for a chart run that fetches symbols batch_size at a time, on the first lookup of
+    any symbol of a batch. A pipeline's fetch stage then makes one request per batch instead of one per symbol,
+    while the data of the later batches still only comes down shortly before those symbols render. Lookups
+    from several threads wait for the batch they need.
+    '''
+
+    def __init__(self, chart_run, symbols, batch_size=4):
+        self.chart_run = chart_run
+        self.batches = [list(symbols[start:start + batch_size]) for start in range(0, len(symbols), batch_size)]
+        self.batch_of = {symbol: position for position, batch in enumerate(self.batches) for symbol in batch}
+        self.locks = [threading.Lock() for _ in self.batches]
+        self.loaded = {}
+
+    def load(self, symbol):
+        position = self.batch_of[symbol]
+        with self.locks[position]:
+            if position not in self.loaded:
+                self.loaded[position] = get_chart_market_data(self.chart_run, self.batches[position])
+        return self.loaded[position]
+
+    def __contains__(self, symbol):
+        return symbol in self.batch_of and symbol in self.load(symbol)
+
+    def __getitem__(self, symbol):
+        return self.load(symbol)[symbol]
+
+
+def fetch_chart_job(chart_run, symbol, market_data=None, manifest=None):
+    # Fetch stage: returns the job (a dict the later stages add to) with the bars to chart, or None if the job
+    # was already recorded today. The symbol's data is fetched on its own when market_data is not given.
+    settings = CHART_RUN_SETTINGS[chart_run]
+    checkpoint = get_job_checkpoint(manifest, chart_run, symbol)
+    if checkpoint and checkpoint.reached('recorded'):
+        log(f"{symbol} {settings['label']} was already recorded today")
+        return None
+
+    def get_bars():
+        data = market_data if market_data is not None else get_chart_market_data(chart_run, [symbol])
+        if symbol not in data:
+            raise ValueError(f"No {settings['period_to_chart']} data was loaded for {symbol}")
+        symbol_data = data[symbol]
+        bars = BarSeries.from_frame(get_stock_data_to_plot(symbol, period_to_chart=settings['period_to_chart'], market_data=symbol_data,
+                                                           **settings['data_kwargs']))
+        return bars, symbol_data.get('prev_close')
+
+    bars, prev_close = get_job_bars(checkpoint, get_bars)
+    return dict(chart_run=chart_run, symbol=symbol, bars=bars, prev_close=prev_close)
+
+
+def render_chart_job(job, in_memory=False, render_workers=1, encoder='moviepy', renderer='incremental', output_profiles=(DEFAULT_OUTPUT_PROFILE,),
+                     target_duration=None, temp_dir='temp_images', manifest=None, encode_workers=None):
+    # Render and encode stage: adds the video of every profile and the change to describe to the job.
+    # Frames never leave this stage, so in-memory frames are not copied between processes.
+    chart_run, symbol = job['chart_run'], job['symbol']
+    settings = CHART_RUN_SETTINGS[chart_run]
+    checkpoint = get_job_checkpoint(manifest, chart_run, symbol)
+    bars = job.pop('bars')
+
+    intro_images = save_intro_images(symbol=symbol, second_image_text=settings['second_image_text'])
+    schedule = schedule_candlestick_frames(len(bars), chart_run, target_duration=target_duration)
+    frames_by_profile, percentage_change = render_job_frames(bars, f"{symbol} {settings['title']}", checkpoint=checkpoint, prev_close=job['prev_close'],
+                                                             in_memory=in_memory, workers=render_workers, renderer=renderer,
+                                                             output_profiles=output_profiles, frame_indices=[index for index, _ in schedule],
+                                                             temp_dir=temp_dir)
+
+    job['daily_change'] = None
+    if settings['describe_change']:
         percentage_change_plus_minus = '+' if float(percentage_change) > 0 else ''
-        percentage_change = str(percentage_change)
-        percentage_change = percentage_change_plus_minus + percentage_change
+        job['daily_change'] = percentage_change_plus_minus + str(percentage_change)
 
-        try:
-            audio_file = get_audio_filename()
-            log(f"audio_file = {audio_file}")
-            create_video(symbol, images, output_filename_marker='intraday', audio_file=audio_file, symbol_daily_change=percentage_change)
-        except OSError:
-            audio_file = get_audio_filename()
-            log(f"RE-DO   audio_file = {audio_file}")
-            create_video(symbol, images, output_filename_marker='intraday', audio_file=audio_file, symbol_daily_change=percentage_change)
+    job['video_filenames'] = encode_profile_videos(symbol, intro_images, frames_by_profile, chart_run, encoder=encoder,
+                                                   candle_durations=[duration for _, duration in schedule], checkpoint=checkpoint,
+                                                   encode_workers=encode_workers)
+    return job
 
-        log(f"Finished {symbol} INTRADAY")
 
+@contextmanager
+def job_workspace(chart_run, symbol):
+    # Every job renders into its own workspace under temp_images/, so concurrent jobs never share frame or intro filenames
+    os.makedirs('temp_images', exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix=f"{symbol}_{chart_run}_", dir='temp_images')
 
-def run_quarterly_charts(symbols):
-    for symbol in symbols:
-        df = get_stock_data_to_plot(symbol, only_get_most_recent_day=False, period_to_chart='quarter')
-        intro_images = save_intro_images(symbol=symbol, second_image_text='LAST 3 MONTHS')
-        images = list(intro_images)
+    try:
+        yield temp_dir
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        gc.collect()
 
-        for i in range(len(df)):
-            log(f"Making image {i + 1} of {len(df)}")
-            subset_df = df.iloc[:i + 1].copy()
-            is_last_image = i == len(df) - 1
-            img = save_candlestick_image(subset_df, i, is_last_image, chart_title=f"{symbol} Last 3 Months")
-            images.append(img)
 
-        try:
-            audio_file = get_audio_filename()
-            log(f"audio_file = {audio_file}")
-            create_video(symbol, images, output_filename_marker='quarterly', audio_file=audio_file)
-        except OSError:
-            audio_file = get_audio_filename()
-            log(f"RE-DO   audio_file = {audio_file}")
-            create_video(symbol, images, output_filename_marker='quarterly', audio_file=audio_file)
+def render_chart_job_in_workspace(job, **kwargs):
+    with job_workspace(job['chart_run'], job['symbol']) as temp_dir:
+        return render_chart_job(job, temp_dir=temp_dir, **kwargs)
 
-        log(f"Finished {symbol} QUARTERLY")
 
+def describe_chart_job(job, manifest=None):
+    # Description stage: the OpenAI request
+    job['video_description'] = describe_videos(job['symbol'], job['daily_change'], checkpoint=get_job_checkpoint(manifest, job['chart_run'], job['symbol']))
+    return job
 
-def run_six_months_charts(symbols):
-    for symbol in symbols:
-        df = get_stock_data_to_plot(symbol, only_get_most_recent_day=False, period_to_chart='six_months')
-        intro_images = save_intro_images(symbol=symbol, second_image_text='LAST 6 MONTHS')
-        images = list(intro_images)
-
-        for i in range(len(df)):
-            log(f"Making image {i} of {len(df)}")
-            subset_df = df.iloc[:i + 1].copy()
-            is_last_image = i == len(df) - 1
-            img = save_candlestick_image(subset_df, i, is_last_image, chart_title=f"{symbol} Last 6 Months")
-            images.append(img)
 
-        try:
-            audio_file = get_audio_filename()
-            log(f"audio_file = {audio_file}")
-            create_video(symbol, images, output_filename_marker='six_months', audio_file=audio_file)
-        except OSError:
-            audio_file = get_audio_filename()
-            log(f"RE-DO   audio_file = {audio_file}")
-            create_video(symbol, images, output_filename_marker='six_months', audio_file=audio_file)
+def record_chart_job(job, manifest=None):
+    # Record stage: the rows of the videos table
+    record_videos(job['symbol'], job['video_filenames'], job['video_description'],
+                  checkpoint=get_job_checkpoint(manifest, job['chart_run'], job['symbol']))
+    log(f"Finished {job['symbol']} {CHART_RUN_SETTINGS[job['chart_run']]['label']}")
+    return job
 
-        log(f"Finished {symbol} SIX MONTHS")
 
+def run_charts(chart_run, symbols, market_data=None, manifest=None, **render_settings):
+    # Run every stage of every symbol in turn. The data of all symbols is fetched at once when market_data
+    # ({symbol: data}) is not given. With a JobManifest, every symbol resumes from the last stage an earlier
+    # attempt completed today.
+    if market_data is None:
+        market_data = get_chart_market_data(chart_run, symbols)
 
-def run_yearly_charts(symbols):
     for symbol in symbols:
-        df = get_stock_data_to_plot(symbol, only_get_most_recent_day=False, period_to_chart='year')
-        intro_images = save_intro_images(symbol=symbol, second_image_text='LAST 12 MONTHS')
-        images = list(intro_images)
+        job = fetch_chart_job(chart_run, symbol, market_data=market_data, manifest=manifest)
+        if job is None:
+            continue
+        job = render_chart_job(job, manifest=manifest, **render_settings)
+        record_chart_job(describe_chart_job(job, manifest=manifest), manifest=manifest)
+
+
+def run_intraday_charts(symbols, **kwargs):
+    # market_data is {symbol: {'1m': frame, '1d': frame, 'prev_close': close}}
+    run_charts('intraday', symbols, **kwargs)
+
+
+class LiveIntradayReplay:
+    '''
+    Builds one symbol's intraday replay while the session is still trading.
+
+    Every ingest() adds the latest 1m bars to an IntradayAggregator, which only re-aggregates the 2-minute
+    bars they touch, and renders just the frames of those bars (plus the previous newest bar, which was drawn
+    as the last frame). Frame i only depends on the first i + 1 bars, so the frames kept from earlier polls are
+    final and the replay is ready to encode as soon as the session closes. Frames no output frame will show
+    are skipped like schedule_candlestick_frames() does for batch runs.
+
+    One chart square is kept per frame, whatever the output profiles; the encoder fits it to each of them.
+    '''
+
+    def __init__(self, symbol, prev_close, in_memory=True, render_workers=1, renderer='incremental', output_profiles=(DEFAULT_OUTPUT_PROFILE,),
+                 target_duration=None, temp_dir='temp_images'):
+        if renderer == 'blit':
+            raise ValueError("The blit renderer lays every frame out for the whole session, it can't render a live replay")
+
+        self.symbol = symbol
+        self.prev_close = prev_close
+        self.chart_title = f"{symbol} Intraday Action"
+        self.render_settings = dict(in_memory=in_memory, workers=render_workers, renderer=renderer, output_profiles=output_profiles,
+                                    temp_dir=temp_dir)
+        self.target_duration = target_duration
+        self.aggregator = IntradayAggregator('2min')
+        self.output_profiles = output_profiles
+        self.frames = {}
+        self.rendered_count = 0
+        self.intro_images = save_intro_images(symbol=symbol)
+
+    def ingest(self, minute_bars):
+        # Returns the number of frames rendered for these minutes
+        first_changed = self.aggregator.update(minute_bars)
+        if first_changed is None:
+            return 0
+
+        bars = self.aggregator.bars(wall_time=True)
+        rendered = self.render(bars, min(first_changed, max(self.rendered_count - 1, 0)))
+        self.rendered_count = len(bars)
+        return rendered
+
+    def render(self, bars, start, indices=None):
+        if indices is None:
+            indices = range(start, len(bars))
+            if not self.target_duration:
+                # Without a target duration a candle's place in the timeline doesn't depend on later candles
+                visible = {index for index, _ in schedule_candlestick_frames(len(bars), 'intraday')}
+                indices = [index for index in indices if index in visible]
+        indices = list(indices)
+        if not indices:
+            return 0
+
+        frames_by_profile, _ = render_candlestick_images(bars, self.chart_title, prev_close=self.prev_close, frame_indices=indices,
+                                                         **self.render_settings)
+        # Every profile gets the same chart squares
+        self.frames.update(zip(indices, frames_by_profile[self.output_profiles[0]]))
+        return len(indices)
+
+    def finish(self, encoder='ffmpeg'):
+        bars = self.aggregator.bars(wall_time=True)
+        if not len(bars):
+            log(f"No bars for {self.symbol}, no live replay to encode")
+            return
+
+        schedule = schedule_candlestick_frames(len(bars), 'intraday', target_duration=self.target_duration)
+        missing = [index for index, _ in schedule if index not in self.frames]
+        if missing:
+            self.render(bars, 0, indices=missing)
+
+        frames = [self.frames[index] for index, _ in schedule]
+        frames_by_profile = {profile: frames for profile in self.output_profiles}
+        percentage_change = precompute_frame_values(bars, self.prev_close)[-1]['percentage_change']
 
-        for i in range(len(df)):
-            log(f"Making image {i} of {len(df)}")
-            subset_df = df.iloc[:i + 1].copy()
-            is_last_image = i == len(df) - 1
-            img = save_candlestick_image(subset_df, i, is_last_image, chart_title=f"{symbol} Last 12 Months")
-            images.append(img)
+        percentage_change_plus_minus = '+' if float(percentage_change) > 0 else ''
+        percentage_change = percentage_change_plus_minus + str(percentage_change)
+
+        create_profile_videos(self.symbol, self.intro_images, frames_by_profile, 'intraday', symbol_daily_change=percentage_change, encoder=encoder,
+                              candle_durations=[duration for _, duration in schedule])
+
+
+def run_live_intraday_charts(symbols, in_memory=True, render_workers=1, encoder='ffmpeg', renderer='incremental', output_profiles=(DEFAULT_OUTPUT_PROFILE,),
+                             target_duration=None, temp_dir='temp_images', poll_seconds=60, exchange='NYSE', close_grace_seconds=90, until=None,
+                             fetch_minute_bars=None):
+    # Poll the 1m bars of all symbols in one batched download per poll during today's session and keep every
+    # symbol's replay rendered up to the latest bar, then encode the videos once the session has closed.
+    # `until` (a tz-aware datetime) overrides the session close plus close_grace_seconds as the end of polling.
+    # fetch_minute_bars(symbols) -> {symbol: 1m frame} replaces the yfinance download.
+    session_times = get_session_times(datetime.date.today(), exchange)
+    if until is None:
+        if session_times is None:
+            log(f"{exchange} has no session today, no live replay")
+            return
+        until = session_times[1] + datetime.timedelta(seconds=close_grace_seconds)
+
+    # Every poll downloads: with the store's 60 second freshness window, polls a minute apart were answered from
+    # the store every other time. The bars still go through the shared store.
+    live_store = BarStore(BAR_STORE.path, freshness_seconds={'1m': 0})
+    fetch_minute_bars = fetch_minute_bars or (lambda symbols: blast_off_many(symbols, interval='1m', store=live_store))
+    prev_closes = get_prev_closes(symbols)
+    replays = {symbol: LiveIntradayReplay(symbol, prev_closes.get(symbol), in_memory=in_memory, render_workers=render_workers,
+                                          renderer=renderer, output_profiles=output_profiles, target_duration=target_duration,
+                                          temp_dir=os.path.join(temp_dir, symbol))
+               for symbol in symbols}
+    last_minutes = {}
+
+    while True:
+        poll_started = time.time()
+        for symbol, minute_bars in fetch_minute_bars(symbols).items():
+            # The newest minute is sent again on the next poll, it may still have been forming
+            if symbol in last_minutes:
+                minute_bars = minute_bars[minute_bars['datetime'] >= last_minutes[symbol]]
+            if len(minute_bars):
+                last_minutes[symbol] = minute_bars['datetime'].max()
+            rendered = replays[symbol].ingest(minute_bars)
+            log(f"{symbol}: {len(replays[symbol].aggregator)} bars, rendered {rendered} new frames")
+
+        if datetime.datetime.now(until.tzinfo) >= until:
+            break
+        time.sleep(max(0, poll_seconds - (time.time() - poll_started)))
+
+    for symbol, replay in replays.items():
+        replay.finish(encoder=encoder)
+        log(f"Finished {symbol} LIVE INTRADAY")
+
+
+def run_quarterly_charts(symbols, **kwargs):
+    # market_data is {symbol: {'quarter': frame}}
+    run_charts('quarterly', symbols, **kwargs)
+
+
+def run_six_months_charts(symbols, **kwargs):
+    # market_data is {symbol: {'six_months': frame}}
+    run_charts('six_months', symbols, **kwargs)
+
+
+def run_yearly_charts(symbols, **kwargs):
+    # market_data is {symbol: {'year': frame}}
+    run_charts('yearly', symbols, **kwargs)
+
+
+CHART_RUNS = {
+    'intraday': run_intraday_charts,
+    'quarterly': run_quarterly_charts,
+    'six_months': run_six_months_charts,
+    'yearly': run_yearly_charts,
+}
+
+
+def run_symbol_job(chart_run, symbol, **kwargs):
+    with job_workspace(chart_run, symbol) as temp_dir:
+        CHART_RUNS[chart_run]([symbol], temp_dir=temp_dir, **kwargs)
+
+    return symbol
+
+
+def run_chart_jobs(chart_run, symbols, max_jobs=2, market_data=None, **kwargs):
+    # Render and encode up to max_jobs symbols at once, each in its own worker process.
+    # A failing symbol is logged and skipped without affecting the others. Returns the symbols that failed.
+    # When market_data was downloaded up front, every job is only sent its own symbol's frames.
+    if chart_run not in CHART_RUNS:
+        raise ValueError(f"Unknown chart run: {chart_run}")
+
+    failed_symbols = []
+
+    with ProcessPoolExecutor(max_workers=max_jobs) as executor:
+        jobs = {}
+        for symbol in symbols:
+            if market_data is not None:
+                if symbol not in market_data:
+                    log(f"{chart_run} job for {symbol} failed: no data was loaded for it")
+                    failed_symbols.append(symbol)
+                    continue
+                kwargs['market_data'] = {symbol: market_data[symbol]}
+            jobs[executor.submit(run_symbol_job, chart_run, symbol, **kwargs)] = symbol
+
+        for job in as_completed(jobs):
+            symbol = jobs[job]
+            try:
+                job.result()
+            except Exception as e:
+                log(f"{chart_run} job for {symbol} failed: {e!r}")
+                failed_symbols.append(symbol)
+
+    return failed_symbols
 
-        try:
-            audio_file = get_audio_filename()
-            log(f"audio_file = {audio_file}")
-            create_video(symbol, images, output_filename_marker='yearly', audio_file=audio_file)
-        except OSError:
-            audio_file = get_audio_filename()
-            log(f"RE-DO   audio_file = {audio_file}")
-            create_video(symbol, images, output_filename_marker='yearly', audio_file=audio_file)
 
-        log(f"Finished {symbol} YEARLY")
+def run_pipelined_chart_jobs(chart_run, symbols, max_jobs=2, io_workers=4, queue_size=2, market_data=None, manifest=None, fetch_batch_size=None,
+                             **render_settings):
+    # Like run_chart_jobs(), but the stages of different symbols overlap: the fetch, description and record stages
+    # run in threads on an asyncio loop, while up to max_jobs symbols render and encode in worker processes.
+    # Later symbols' data comes down and earlier symbols' descriptions are requested while a symbol renders.
+    # queue_size bounds how many jobs wait between two stages, so fetching does not run far ahead of rendering.
+    # Without market_data the symbols are fetched fetch_batch_size at a time (by default as many as can be rendering
+    # or waiting to render), one batched request each. Returns the symbols that failed.
+    if chart_run not in CHART_RUNS:
+        raise ValueError(f"Unknown chart run: {chart_run}")
+
+    if market_data is None:
+        market_data = BatchedMarketData(chart_run, list(symbols), batch_size=fetch_batch_size or max_jobs + queue_size)
+
+    stages = [
+        Stage('fetch', partial(fetch_chart_job, chart_run, market_data=market_data, manifest=manifest), workers=io_workers),
+        Stage('render', partial(render_chart_job_in_workspace, manifest=manifest, **render_settings), workers=max_jobs, processes=True),
+        Stage('describe', partial(describe_chart_job, manifest=manifest), workers=io_workers),
+        Stage('record', partial(record_chart_job, manifest=manifest)),
+    ]
+    failures = run_pipeline(symbols, stages, queue_size=queue_size)
+    for symbol, stage in failures.items():
+        log(f"{chart_run} job for {symbol} failed in the {stage} stage")
+
+    return list(failures)
 
 
 def main():
@@ -387,18 +1402,37 @@ def main():
         create_animated_text_videos_db()
 
         symbols = ['GME', 'SPY', 'TSLA', 'AAPL', 'NET', 'META', 'MSFT', 'NFLX', 'AMZN', 'NVDA', 'QQQ', 'GOOG', 'PLTR',]
-
-        run_intraday_charts(symbols)
+        # Several symbols are rendered and encoded at once; the CPUs are split between the symbol jobs, for rendering
+        # and for the segment processes of encoder='ffmpeg_segments'
+        max_jobs = min(4, len(symbols))
+        render_workers = max(1, (os.cpu_count() or 1) // max_jobs)
+        # A rerun on the same day resumes every job from the last stage its earlier attempt completed
+        manifest = JobManifest('jobs/manifest.sqlite', jobs_dir='jobs')
+        manifest.prune_job_dirs()
+        # The videos keep their per-candle durations (target_duration=None), so every candle is rendered. A shorter
+        # target_duration (e.g. 15 seconds) also renders only the candles an output frame shows.
+        job_settings = dict(max_jobs=max_jobs, in_memory=True, render_workers=render_workers, encode_workers=render_workers, encoder='ffmpeg',
+                            output_profiles=('square', 'vertical'), manifest=manifest, target_duration=None)
+
+        # Live mode instead: started before the open, it renders during the session and encodes right after the close
+        # run_live_intraday_charts(symbols, in_memory=True, encoder='ffmpeg', output_profiles=('square', 'vertical'))
+
+        # The symbols' bars are fetched a batch at a time (one request for several symbols) while the symbols before
+        # them render, and described and recorded while the ones after them render. run_chart_jobs() with
+        # market_data=get_intraday_market_data(symbols) fetches all of them in two batched requests first instead.
+        failed_symbols = run_pipelined_chart_jobs('intraday', symbols, **job_settings)
+        if failed_symbols:
+            log(f"Intraday videos failed for {failed_symbols}")
         delete_video_and_record_if_uploaded('/var/www/html/members.managed.capital/stock_videos')
         gc.collect()
 
-        # run_quarterly_charts(symbols)
+        # run_chart_jobs('quarterly', symbols, market_data=get_sql_market_data(symbols, 'quarter'), **job_settings)
         # gc.collect()
         #
-        # run_six_months_charts(symbols)
+        # run_chart_jobs('six_months', symbols, market_data=get_sql_market_data(symbols, 'six_months'), **job_settings)
         # gc.collect()
         #
-        # run_yearly_charts(symbols)
+        # run_chart_jobs('yearly', symbols, market_data=get_sql_market_data(symbols, 'year'), **job_settings)
         # gc.collect()
 
         clean_temp_files()
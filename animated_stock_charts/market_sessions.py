@@ -0,0 +1,130 @@
+import datetime
+import numpy as np
+import pandas as pd
+import pandas_market_calendars as mcal
+
+_calendars = {}
+_session_indexes = {}
+
+
+def get_calendar(exchange='NYSE'):
+    if exchange not in _calendars:
+        _calendars[exchange] = mcal.get_calendar(exchange)
+    return _calendars[exchange]
+
+
+class SessionIndex:
+    '''
+    The trading sessions of one exchange in one calendar year, with their open and close times (early closes
+    included), built once from the exchange calendar.
+
+    Every day of the year maps to the position of the most recent session on or before it, so checking a date,
+    stepping back through sessions and looking up open/close times are all array lookups.
+    '''
+
+    def __init__(self, exchange, year):
+        self.exchange = exchange
+        self.year = year
+        self.tz = str(get_calendar(exchange).tz)
+
+        schedule = get_calendar(exchange).schedule(start_date=f'{year}-01-01', end_date=f'{year}-12-31')
+        self.sessions = pd.DatetimeIndex(schedule.index).normalize()
+        self.opens = pd.DatetimeIndex(schedule['market_open']).tz_convert(self.tz)
+        self.closes = pd.DatetimeIndex(schedule['market_close']).tz_convert(self.tz)
+
+        # For every day of the year, the position of the latest session on or before it (-1 before the first one)
+        days = pd.date_range(f'{year}-01-01', f'{year}-12-31', freq='D')
+        self.latest_session = np.searchsorted(self.sessions.asi8, days.asi8, side='right') - 1
+        self.is_session_day = np.zeros(len(days), dtype=bool)
+        self.is_session_day[self.sessions.dayofyear - 1] = True
+
+    def day_number(self, date):
+        return pd.Timestamp(date).dayofyear - 1
+
+
+def get_session_index(exchange='NYSE', year=None):
+    '''Return the SessionIndex for exchange and year, built on first use and kept for the life of the process.'''
+    year = year or datetime.date.today().year
+    key = (exchange, year)
+    if key not in _session_indexes:
+        _session_indexes[key] = SessionIndex(exchange, year)
+    return _session_indexes[key]
+
+
+def is_session(date, exchange='NYSE'):
+    '''Return True if the exchange trades on date (half days included).'''
+    date = pd.Timestamp(date)
+    index = get_session_index(exchange, date.year)
+    return bool(index.is_session_day[index.day_number(date)])
+
+
+def get_session(date=None, sessions_back=0, exchange='NYSE'):
+    '''
+    Return the date of the most recent session on or before date (today by default), or of the session
+    sessions_back sessions before that one.
+    '''
+    date = pd.Timestamp(date or datetime.date.today()).normalize()
+    if date.tzinfo is not None:
+        date = date.tz_localize(None)
+
+    while True:
+        index = get_session_index(exchange, date.year)
+        position = index.latest_session[index.day_number(date)] - sessions_back
+        if position >= 0:
+            return index.sessions[position]
+
+        # Carry on from the end of the previous year with the sessions not yet stepped over
+        sessions_back = -position - 1
+        date = pd.Timestamp(date.year - 1, 12, 31)
+
+
+def get_previous_session(date=None, days_back=1, exchange='NYSE'):
+    '''
+    Return the date of the exchange session `days_back` sessions before the most recent session on or before
+    `date` (today by default). days_back=0 returns that most recent session itself.
+    '''
+    return get_session(date, days_back, exchange)
+
+
+def get_session_times(date, exchange='NYSE'):
+    '''Return the (open, close) times of the session on date in the exchange's timezone, or None if it does not trade.'''
+    date = pd.Timestamp(date)
+    if not is_session(date, exchange):
+        return None
+
+    index = get_session_index(exchange, date.year)
+    position = index.latest_session[index.day_number(date)]
+    return index.opens[position], index.closes[position]
+
+
+def get_session_closes(timestamps, exchange='NYSE'):
+    '''
+    Return, for every timestamp, the close time of the session on its date (in the exchange's timezone), or
+    NaT if the exchange does not trade that day. Naive timestamps are taken to be exchange local time.
+    '''
+    timestamps = pd.DatetimeIndex(timestamps)
+    tz = str(get_calendar(exchange).tz)
+    timestamps = timestamps.tz_localize(tz) if timestamps.tz is None else timestamps.tz_convert(tz)
+    dates = timestamps.tz_localize(None).normalize()
+
+    closes = pd.Series(pd.NaT, index=range(len(dates)), dtype=f'datetime64[ns, {tz}]')
+    for year in np.unique(dates.year):
+        index = get_session_index(exchange, year)
+        in_year = np.flatnonzero(dates.year == year)
+        days = dates[in_year].dayofyear - 1
+        trading = index.is_session_day[days]
+        closes.iloc[in_year[trading]] = index.closes[index.latest_session[days[trading]]]
+
+    return pd.DatetimeIndex(closes)
+
+
+def drop_bars_after_close(data, exchange='NYSE'):
+    '''
+    Drop intraday bars at or after their session's close (and bars on days the exchange does not trade).
+    yfinance returns a bad bar stamped at the close, which is 16:00 on regular days and earlier on half days.
+    '''
+    timestamps = pd.DatetimeIndex(pd.to_datetime(data['datetime']))
+    closes = get_session_closes(timestamps, exchange)
+    if timestamps.tz is None:
+        closes = closes.tz_localize(None)
+    return data[np.asarray(timestamps < closes)]
@@ -0,0 +1,88 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+# Put on a stage's queue once per worker when the stage before it has finished
+_DONE = object()
+
+
+def log(msg):
+    '''Simple logging with timestamp.'''
+    print(f'\n{datetime.now()} {msg}')
+
+
+class Stage:
+    '''
+    One stage of a pipeline: function is called with the previous stage's result for an item (the item itself
+    for the first stage) by `workers` workers, in threads for I/O-bound stages or in worker processes for
+    CPU-bound ones (processes=True, function and its arguments must then be picklable).
+    '''
+
+    def __init__(self, name, function, workers=1, processes=False):
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.processes = processes
+
+
+def run_pipeline(items, stages, queue_size=2):
+    '''
+    Run every item through stages, with the stages of different items overlapping, and return
+    {item: name of the stage that failed} for the items that failed.
+
+    Stages are connected by queues holding at most queue_size items, so a fast stage only runs that far ahead
+    of a slow one. A stage that returns None ends the item there (e.g. a job already done). A failing item is
+    logged and dropped without affecting the others.
+    '''
+    return asyncio.run(run_stages(list(items), stages, queue_size))
+
+
+async def run_stages(items, stages, queue_size=2):
+    loop = asyncio.get_running_loop()
+    executors = [(ProcessPoolExecutor if stage.processes else ThreadPoolExecutor)(max_workers=stage.workers) for stage in stages]
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+    failures = {}
+
+    # Worker processes are started before any thread runs: a process forked while another thread holds a lock
+    # (the one around stdout, say) inherits it locked and can hang on it
+    for stage, executor in zip(stages, executors):
+        if stage.processes:
+            executor.submit(int).result()
+
+    async def feed():
+        for item in items:
+            await queues[0].put((item, item))
+        for _ in range(stages[0].workers):
+            await queues[0].put(_DONE)
+
+    async def work(position):
+        stage = stages[position]
+        while True:
+            entry = await queues[position].get()
+            if entry is _DONE:
+                return
+
+            item, value = entry
+            try:
+                result = await loop.run_in_executor(executors[position], stage.function, value)
+            except Exception as e:
+                log(f"{stage.name} stage failed for {item}: {e!r}")
+                failures[item] = stage.name
+                continue
+
+            if result is not None and position + 1 < len(stages):
+                await queues[position + 1].put((item, result))
+
+    async def run_stage(position):
+        await asyncio.gather(*[work(position) for _ in range(stages[position].workers)])
+        if position + 1 < len(stages):
+            for _ in range(stages[position + 1].workers):
+                await queues[position + 1].put(_DONE)
+
+    try:
+        await asyncio.gather(feed(), *[run_stage(position) for position in range(len(stages))])
+    finally:
+        for executor in executors:
+            executor.shutdown()
+
+    return failures
@@ -0,0 +1,247 @@
+import os
+import numpy as np
+import matplotlib.dates as mdates
+from matplotlib import font_manager
+from matplotlib.ticker import MaxNLocator
+from mplfinance._helpers import _determine_format_string
+from mplfinance._widths import _widths, _dfinterpolate
+from PIL import Image, ImageDraw, ImageFont, ImageColor
+
+# Colours of the mplfinance 'yahoo' style
+FIGURE_COLOR = (255, 255, 255)
+AXES_COLOR = '#fafafa'
+GRID_COLOR = '#d0d0d0'
+TEXT_COLOR = '#101010'
+UP_COLOR = '#00b060'
+DOWN_COLOR = '#fe3032'
+WICK_COLOR = '#606060'
+CANDLE_ALPHA = 0.9
+LEGEND_COLORS = {'close': '#aaaaaa', 'prev_close': 'navy', 'green': 'green', 'red': 'red'}
+
+# Layout of a 1080px wide frame. Everything is scaled by width / 1080 for other output sizes.
+BASE_WIDTH = 1080
+MARGINS = {'left': 30, 'top': 55, 'right': 68, 'bottom': 88}
+FONT_SIZES = {'title': 23, 'tick': 15, 'legend': 15, 'xlabel': 18, 'ylabel': 15}
+# Matplotlib line widths are in points: dpi=180 frames (~1850px wide) resized down to 1080px
+PIXELS_PER_POINT = 180 / 72 * BASE_WIDTH / 1850
+# save_candlestick_image() draws the last-frame line 115px from the right edge of a ~1850px wide image
+LAST_IMAGE_LINE_OFFSET = 67
+
+
+def blend(color, background, alpha):
+    '''Return the RGB tuple of `color` drawn with `alpha` on top of `background`.'''
+    color = np.array(ImageColor.getrgb(color)[:3], dtype=float)
+    background = np.array(ImageColor.getrgb(background)[:3], dtype=float)
+    return tuple(int(round(c)) for c in alpha * color + (1 - alpha) * background)
+
+
+def find_font_file(family='sans-serif', weight='normal'):
+    # Use the same font files matplotlib would pick, so both backends share typography
+    return font_manager.findfont(font_manager.FontProperties(family=family, weight=weight))
+
+
+def format_ticks(values):
+    # Use the fewest decimals that still show every tick value exactly, like matplotlib's ScalarFormatter
+    for decimals in range(5):
+        if np.allclose(np.round(values, decimals), values, rtol=0, atol=1e-9):
+            break
+    return [f'{value:.{decimals}f}' for value in values]
+
+
+class RasterCandlestickRenderer:
+    '''
+    Rasterizes candlestick frames directly into an RGB array with NumPy and PIL.
+
+    The chart follows the layout of the mplfinance 'yahoo' style used by save_candlestick_image():
+    title on top, price axis on the right, rotated time labels, grid, prev-close line and the
+    four-entry legend in the upper left. The axis limits follow the same per-frame rules as the
+    incremental renderer. Frames are drawn at the output size, so they need no resize.
+    '''
+
+    def __init__(self, bars, frame_values, chart_title=None, size=(1080, 1080), temp_dir='temp_images'):
+        if not chart_title:
+            raise ValueError("Symbol needs to be specified in RasterCandlestickRenderer()")
+
+        self.bars = bars
+        self.frame_values = frame_values
+        self.temp_dir = temp_dir
+        self.width, self.height = size
+        self.scale = self.width / BASE_WIDTH
+
+        self.plot_left = int(MARGINS['left'] * self.scale)
+        self.plot_top = int(MARGINS['top'] * self.scale)
+        self.plot_right = self.width - int(MARGINS['right'] * self.scale)
+        self.plot_bottom = self.height - int(MARGINS['bottom'] * self.scale)
+
+        regular_font = find_font_file()
+        bold_font = find_font_file(weight='bold')
+        cursive_font = find_font_file(family='cursive')
+        self.fonts = {
+            'title': ImageFont.truetype(cursive_font, int(FONT_SIZES['title'] * self.scale)),
+            'tick': ImageFont.truetype(regular_font, int(FONT_SIZES['tick'] * self.scale)),
+            'legend': ImageFont.truetype(regular_font, int(FONT_SIZES['legend'] * self.scale)),
+            'legend_bold': ImageFont.truetype(bold_font, int(FONT_SIZES['legend'] * self.scale)),
+            'xlabel': ImageFont.truetype(cursive_font, int(FONT_SIZES['xlabel'] * self.scale)),
+            'ylabel': ImageFont.truetype(regular_font, int(FONT_SIZES['ylabel'] * self.scale)),
+        }
+
+        self.opens = bars.open.astype(float, copy=False)
+        self.highs = bars.high.astype(float, copy=False)
+        self.lows = bars.low.astype(float, copy=False)
+        self.closes = bars.close.astype(float, copy=False)
+        self.datetimes = bars.index.to_pydatetime()
+        self.dates = mdates.date2num(self.datetimes)
+
+        axes_color = ImageColor.getrgb(AXES_COLOR)
+        self.up_color = blend(UP_COLOR, AXES_COLOR, CANDLE_ALPHA)
+        self.down_color = blend(DOWN_COLOR, AXES_COLOR, CANDLE_ALPHA)
+        self.wick_color = ImageColor.getrgb(WICK_COLOR)
+
+        # Rendered (and rotated) tick labels, keyed by text, font size and angle
+        self.rotated_labels = {}
+
+        # Static layer: figure/axes background, title and the price label
+        self.background = Image.new('RGB', size, FIGURE_COLOR)
+        draw = ImageDraw.Draw(self.background)
+        draw.rectangle([self.plot_left, self.plot_top, self.plot_right, self.plot_bottom], fill=axes_color)
+        draw.text(((self.plot_left + self.plot_right) / 2, self.plot_top / 2), chart_title, font=self.fonts['title'],
+                  fill=TEXT_COLOR, anchor='mm')
+        self.paste_rotated_text(self.background, 'Price', self.fonts['ylabel'], 90,
+                                (self.width - int(18 * self.scale), (self.plot_top + self.plot_bottom) // 2), anchor='center')
+
+    def paste_rotated_text(self, img, text, font, angle, position, anchor='center'):
+        key = (text, font.size, angle)
+        label = self.rotated_labels.get(key)
+        if label is None:
+            left, top, right, bottom = font.getbbox(text)
+            label = Image.new('L', (right - left + 2, bottom - top + 2), 0)
+            ImageDraw.Draw(label).text((1 - left, 1 - top), text, font=font, fill=255)
+            label = label.rotate(angle, expand=True, resample=Image.BICUBIC)
+            self.rotated_labels[key] = label
+
+        x, y = position
+        if anchor == 'center':
+            x, y = x - label.width // 2, y - label.height // 2
+        elif anchor == 'top_right':
+            x = x - label.width
+
+        img.paste(ImageColor.getrgb(TEXT_COLOR), (int(x), int(y)), label)
+
+    def to_pixels_x(self, values, x_limits):
+        x_min, x_max = x_limits
+        return self.plot_left + (np.asarray(values) - x_min) / (x_max - x_min) * (self.plot_right - self.plot_left)
+
+    def to_pixels_y(self, values, y_limits):
+        y_min, y_max = y_limits
+        return self.plot_bottom - (np.asarray(values) - y_min) / (y_max - y_min) * (self.plot_bottom - self.plot_top)
+
+    def render(self, index, is_last_image=False, in_memory=False):
+        count = index + 1
+        values = self.frame_values[index]
+
+        # Same x-limits as mplfinance with tight_layout=True for a plot of `count` candles
+        avg_dist_between_points = (count - 1) / float(count)
+        x_limits = (-0.45 * avg_dist_between_points, count - 1 + 0.45 * avg_dist_between_points)
+        if count == 1:
+            x_limits = (x_limits[0] - 0.75, x_limits[1] + 0.75)
+        y_limits = (values['y_min'], values['y_max'])
+
+        img = self.background.copy()
+        draw = ImageDraw.Draw(img)
+
+        self.draw_grid_and_ticks(img, draw, count, x_limits, y_limits)
+        self.draw_candles(draw, count, x_limits, y_limits)
+
+        hline_y = float(self.to_pixels_y(values['hline_value'], y_limits))
+        line_width = max(1, int(round(1.6 * _dfinterpolate(_widths, count, 'lw') * PIXELS_PER_POINT * self.scale)))
+        draw.line([(self.to_pixels_x(0, x_limits), hline_y), (self.to_pixels_x(count - 1, x_limits), hline_y)],
+                  fill=LEGEND_COLORS['prev_close'], width=line_width)
+
+        self.draw_legend(draw, values)
+        draw.text(((self.plot_left + self.plot_right) / 2, self.height - int(22 * self.scale)), values['formatted_date'],
+                  font=self.fonts['xlabel'], fill=TEXT_COLOR, anchor='mm')
+
+        if is_last_image:
+            line_x = self.width - int(LAST_IMAGE_LINE_OFFSET * self.scale)
+            draw.line([(line_x, 0), (line_x, self.height)], fill='black', width=1)
+
+        if in_memory:
+            return np.asarray(img), values['percentage_change']
+
+        filename = os.path.join(self.temp_dir, f"temp_candlestick_image_{index}.png")
+        img.save(filename)
+        return filename, values['percentage_change']
+
+    def draw_grid_and_ticks(self, img, draw, count, x_limits, y_limits):
+        tick_font = self.fonts['tick']
+
+        y_ticks = MaxNLocator(nbins=8, steps=[1, 2, 2.5, 5, 10]).tick_values(*y_limits)
+        y_ticks = y_ticks[(y_ticks >= y_limits[0]) & (y_ticks <= y_limits[1])]
+        for tick, label in zip(y_ticks, format_ticks(y_ticks)):
+            y = float(self.to_pixels_y(tick, y_limits))
+            draw.line([(self.plot_left, y), (self.plot_right, y)], fill=GRID_COLOR, width=1)
+            draw.text((self.plot_right + int(8 * self.scale), y), label, font=tick_font, fill=TEXT_COLOR, anchor='lm')
+
+        fmt = _determine_format_string(self.dates[:count])
+        x_ticks = MaxNLocator(nbins=8, steps=[1, 2, 2.5, 5, 10]).tick_values(*x_limits)
+        x_ticks = x_ticks[(x_ticks >= x_limits[0]) & (x_ticks <= x_limits[1])]
+        for tick in x_ticks:
+            position = int(np.round(tick))
+            x = float(self.to_pixels_x(tick, x_limits))
+            draw.line([(x, self.plot_top), (x, self.plot_bottom)], fill=GRID_COLOR, width=1)
+            if 0 <= position < count:
+                label = self.datetimes[position].strftime(fmt)
+                self.paste_rotated_text(img, label, tick_font, 45, (x + int(4 * self.scale), self.plot_bottom + int(6 * self.scale)),
+                                        anchor='top_right')
+
+    def draw_candles(self, draw, count, x_limits, y_limits):
+        delta = _dfinterpolate(_widths, count, 'cw') / 2.0
+        x_centers = self.to_pixels_x(np.arange(count), x_limits)
+        half_width = max(0.5, delta * (self.plot_right - self.plot_left) / (x_limits[1] - x_limits[0]))
+
+        opens = self.to_pixels_y(self.opens[:count], y_limits)
+        closes = self.to_pixels_y(self.closes[:count], y_limits)
+        highs = self.to_pixels_y(self.highs[:count], y_limits)
+        lows = self.to_pixels_y(self.lows[:count], y_limits)
+        body_tops = np.minimum(opens, closes)
+        body_bottoms = np.maximum(opens, closes)
+        is_up = self.opens[:count] < self.closes[:count]
+
+        for i in range(count):
+            x = x_centers[i]
+            draw.line([(x, highs[i]), (x, lows[i])], fill=self.wick_color, width=1)
+            draw.rectangle([x - half_width, body_tops[i], x + half_width, max(body_bottoms[i], body_tops[i] + 1)],
+                           fill=self.up_color if is_up[i] else self.down_color)
+
+    def draw_legend(self, draw, values):
+        gain_loss_color = LEGEND_COLORS[values['gain_loss_color']]
+        entries = [
+            (values['legend_labels'][0], LEGEND_COLORS['close'], TEXT_COLOR, self.fonts['legend']),
+            (values['legend_labels'][1], LEGEND_COLORS['prev_close'], TEXT_COLOR, self.fonts['legend']),
+            (values['legend_labels'][2], gain_loss_color, gain_loss_color, self.fonts['legend_bold']),
+            (values['legend_labels'][3], gain_loss_color, gain_loss_color, self.fonts['legend_bold']),
+        ]
+
+        padding = int(8 * self.scale)
+        row_height = int(20 * self.scale)
+        handle_length = int(30 * self.scale)
+        marker_radius = int(7 * self.scale)
+        text_width = max(draw.textlength(label, font=font) for label, _, _, font in entries)
+
+        left = self.plot_left + int(6 * self.scale)
+        top = self.plot_top + int(6 * self.scale)
+        right = left + padding + handle_length + padding + text_width + padding
+        bottom = top + padding + row_height * len(entries) + padding // 2
+        draw.rounded_rectangle([left, top, right, bottom], radius=int(4 * self.scale), fill=(255, 255, 255), outline='#cccccc')
+
+        for row, (label, handle_color, text_color, font) in enumerate(entries):
+            y = top + padding + row_height * row + row_height // 2
+            handle_left = left + padding
+            draw.line([(handle_left, y), (handle_left + handle_length, y)], fill=handle_color, width=max(1, int(2 * self.scale)))
+            center = handle_left + handle_length // 2
+            draw.ellipse([center - marker_radius, y - marker_radius, center + marker_radius, y + marker_radius], fill=handle_color)
+            draw.text((handle_left + handle_length + padding, y), label, font=font, fill=text_color, anchor='lm')
+
+    def close(self):
+        self.rotated_labels.clear()
+
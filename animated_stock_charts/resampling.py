@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+
+from bar_series import BarSeries
+
+OHLC_AGGREGATIONS = {
+    'open': 'first',
+    'high': 'max',
+    'low': 'min',
+    'close': 'last',
+    'volume': 'sum',
+}
+
+
+DAY_NS = 24 * 60 * 60 * 10 ** 9
+
+
+def to_datetime_index(nanoseconds, tz=None):
+    # asi8 of a tz-aware index is UTC, so rebuild tz-aware indexes from UTC
+    if tz is None:
+        return pd.DatetimeIndex(nanoseconds.astype('datetime64[ns]'))
+    return pd.DatetimeIndex(nanoseconds.astype('datetime64[ns]')).tz_localize('UTC').tz_convert(tz)
+
+
+def resample_ohlc(input_dataframe, freq, group_column=None, fill_gaps=True):
+    '''
+    Build OHLC(V) bars of `freq` (a pandas offset such as '2min') for many sessions, and optionally many
+    symbols, in one vectorized pass.
+
+    Every session (calendar day of the 'datetime' column in its own timezone, per group_column value when
+    given) is binned independently, with bars counted from the session's first timestamp, which matches
+    resample(origin='start') applied to one day at a time. The result is indexed by bar start and has the
+    group column, a 'datetime' column equal to the index and the aggregated open/high/low/close (and volume
+    if present) columns. With fill_gaps, empty bins inside a session are kept as NaN rows, as resample() does.
+    '''
+    freq_ns = pd.Timedelta(pd.tseries.frequencies.to_offset(freq)).value
+    index = pd.DatetimeIndex(pd.to_datetime(input_dataframe['datetime']))
+    times = index.asi8
+    days = (index.tz_localize(None).asi8 if index.tz is not None else times) // DAY_NS
+    if group_column:
+        group_codes, group_names = pd.factorize(input_dataframe[group_column], sort=True)
+    else:
+        group_codes, group_names = np.zeros(len(index), dtype=np.int64), None
+
+    order = np.lexsort((times, days, group_codes))
+    times, days, group_codes = times[order], days[order], group_codes[order]
+
+    # Session origins and the bar every row falls into
+    new_session = np.ones(len(times), dtype=bool)
+    new_session[1:] = (days[1:] != days[:-1]) | (group_codes[1:] != group_codes[:-1])
+    session_ids = np.cumsum(new_session) - 1
+    origins = times[new_session]
+    bins = origins[session_ids] + (times - origins[session_ids]) // freq_ns * freq_ns
+
+    new_bar = new_session.copy()
+    new_bar[1:] |= bins[1:] != bins[:-1]
+    bar_starts = np.flatnonzero(new_bar)
+    bar_ends = np.append(bar_starts[1:], len(times)) - 1
+
+    columns = [column for column in OHLC_AGGREGATIONS if column in input_dataframe.columns]
+    bars = {}
+    for column in columns:
+        values = input_dataframe[column].to_numpy(dtype=float)[order]
+        aggregation = OHLC_AGGREGATIONS[column]
+        if aggregation == 'first':
+            bars[column] = values[bar_starts]
+        elif aggregation == 'last':
+            bars[column] = values[bar_ends]
+        elif aggregation == 'max':
+            bars[column] = np.fmax.reduceat(values, bar_starts)
+        elif aggregation == 'min':
+            bars[column] = np.fmin.reduceat(values, bar_starts)
+        else:
+            bars[column] = np.add.reduceat(np.nan_to_num(values), bar_starts)
+
+    bar_times = bins[bar_starts]
+    bar_groups = group_codes[bar_starts]
+
+    if fill_gaps:
+        # Lay every session out on its full grid of bins and scatter the bars into it
+        bar_sessions = session_ids[bar_starts]
+        bin_numbers = (bar_times - origins[bar_sessions]) // freq_ns
+        bins_per_session = np.zeros(len(origins), dtype=np.int64)
+        np.maximum.at(bins_per_session, bar_sessions, bin_numbers + 1)
+
+        if bins_per_session.sum() != len(bar_times):
+            session_offsets = np.cumsum(bins_per_session) - bins_per_session
+            grid_sessions = np.repeat(np.arange(len(origins)), bins_per_session)
+            grid_times = origins[grid_sessions] + (np.arange(len(grid_sessions)) - session_offsets[grid_sessions]) * freq_ns
+            positions = session_offsets[bar_sessions] + bin_numbers
+
+            for column in columns:
+                filled = np.full(len(grid_times), np.nan)
+                filled[positions] = bars[column]
+                bars[column] = filled
+            bar_times = grid_times
+            bar_groups = group_codes[new_session][grid_sessions]
+
+    bar_index = to_datetime_index(bar_times, index.tz)
+    result = pd.DataFrame(bars, index=bar_index)
+    result.insert(0, 'datetime', bar_index)
+    if group_column:
+        result.insert(0, group_column, np.asarray(group_names)[bar_groups])
+
+    return result
+
+
+def shift_weekends_to_monday(index):
+    '''Move Saturday and Sunday timestamps to the following Monday.'''
+    days = np.select([index.weekday == 5, index.weekday == 6], [2, 1], 0)
+    return index + pd.to_timedelta(days, unit='D')
+
+
+def resample_daily_ohlc(input_dataframe, days=1):
+    '''
+    Build N-day OHLC(V) bars from daily data in one resample() call, with bars that start on a weekend
+    moved to the following Monday.
+    '''
+    index = pd.DatetimeIndex(pd.to_datetime(input_dataframe['datetime']))
+    columns = [column for column in OHLC_AGGREGATIONS if column in input_dataframe.columns]
+    values = input_dataframe[columns].set_axis(index, axis=0)
+
+    bars = values.resample(f'{days}D').agg({column: OHLC_AGGREGATIONS[column] for column in columns})
+    bars.index = shift_weekends_to_monday(bars.index)
+    bars.insert(0, 'datetime', bars.index)
+
+    return bars
+
+
+class IntradayAggregator:
+    '''
+    Keeps the `freq` OHLC bars of one session up to date while its 1m bars arrive, for live replays.
+
+    Bars are counted from the first timestamp ingested, like resample_ohlc() does for a whole day, and
+    bar k covers origin + k * freq. update() only re-aggregates the bars from the one holding the earliest
+    new (or revised) minute onwards, so a poll costs the few new minutes instead of the whole day.
+    bars() returns the same bars resample_ohlc() would build from all minutes ingested so far.
+    '''
+
+    def __init__(self, freq='2min'):
+        self.freq_ns = pd.Timedelta(pd.tseries.frequencies.to_offset(freq)).value
+        self.origin = None
+        self.tz = None
+        self.minute_times = np.empty(0, dtype=np.int64)
+        self.minute_prices = np.empty((0, 4))
+        self.prices = np.empty((0, 4))
+
+    def update(self, minute_bars):
+        '''
+        Ingest 1m bars (a DataFrame with 'datetime' and open/high/low/close columns). Minutes already ingested
+        are replaced by their new values. Returns the index of the first bar that changed, or None.
+        '''
+        if not len(minute_bars):
+            return None
+
+        index = pd.DatetimeIndex(pd.to_datetime(minute_bars['datetime']))
+        order = np.argsort(index.asi8, kind='stable')
+        times = index.asi8[order]
+        prices = minute_bars[['open', 'high', 'low', 'close']].to_numpy(dtype=float)[order]
+        if self.origin is None:
+            self.origin = times[0]
+            self.tz = index.tz
+        if times[0] < self.origin:
+            raise ValueError("Minute bars before the start of the session")
+
+        # Keep the minutes before the first new one and append the new ones (the last of any duplicates wins)
+        keep = self.minute_times < times[0]
+        last_of_duplicates = np.append(times[1:] != times[:-1], True)
+        self.minute_times = np.concatenate([self.minute_times[keep], times[last_of_duplicates]])
+        self.minute_prices = np.concatenate([self.minute_prices[keep], prices[last_of_duplicates]])
+
+        first_changed = (times[0] - self.origin) // self.freq_ns
+        tail = self.minute_times >= self.origin + first_changed * self.freq_ns
+        bar_numbers = (self.minute_times[tail] - self.origin) // self.freq_ns
+        tail_prices = self.minute_prices[tail]
+
+        # Aggregate the tail minutes into bars first_changed onwards, empty bins staying NaN as in resample_ohlc()
+        starts = np.flatnonzero(np.append(True, bar_numbers[1:] != bar_numbers[:-1]))
+        ends = np.append(starts[1:], len(bar_numbers)) - 1
+        tail_bars = np.full((bar_numbers[-1] - first_changed + 1, 4), np.nan)
+        positions = bar_numbers[starts] - first_changed
+        tail_bars[positions, 0] = tail_prices[starts, 0]
+        tail_bars[positions, 1] = np.fmax.reduceat(tail_prices[:, 1], starts)
+        tail_bars[positions, 2] = np.fmin.reduceat(tail_prices[:, 2], starts)
+        tail_bars[positions, 3] = tail_prices[ends, 3]
+
+        self.prices = np.concatenate([self.prices[:first_changed], tail_bars])
+        return int(first_changed)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def bars(self, wall_time=False):
+        '''
+        Return the bars so far as a BarSeries. With wall_time, tz-aware bars are returned as naive exchange
+        wall times, the way get_stock_data_to_plot() indexes intraday bars for the charts.
+        '''
+        timestamps = self.origin + np.arange(len(self.prices), dtype=np.int64) * self.freq_ns
+        bars = BarSeries(timestamps, *self.prices.T, tz=self.tz)
+        if wall_time and self.tz is not None:
+            bars = BarSeries(bars.index.tz_localize(None).asi8, *self.prices.T)
+        return bars
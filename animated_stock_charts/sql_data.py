@@ -0,0 +1,84 @@
+import os
+import re
+import pandas as pd
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.exc import SQLAlchemyError
+
+# Rows loaded per symbol table for each period
+PERIOD_LIMITS = {
+    '1m': 500,
+    'quarter': 65,
+    'six_months': 127,
+    'year': 253,
+}
+
+TABLE_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.\-]+$')
+
+_engines = {}
+
+QUERY_ERRORS = (SQLAlchemyError, pd.errors.DatabaseError)
+
+
+def log(msg):
+    '''Simple logging with timestamp.'''
+    print(f'\n{datetime.now()} {msg}')
+
+
+def get_engine(connection_string, **kwargs):
+    '''
+    Return the process-wide engine (and so connection pool) for connection_string, creating it on first use.
+
+    Engines are kept per process: a pool inherited through fork would share its open connections with the
+    parent, so worker processes get their own. Pooled connections are checked before use instead of being
+    recycled after a second, which reconnected on almost every query.
+    '''
+    key = (os.getpid(), connection_string)
+    if key not in _engines:
+        _engines[key] = create_engine(connection_string, pool_pre_ping=True, pool_recycle=3600, **kwargs)
+    return _engines[key]
+
+
+def get_table_name(symbol, period_to_chart):
+    return f"{symbol}_1m_data" if period_to_chart == '1m' else f"{symbol}_daily"
+
+
+def load_last_rows(engine, tables, limit_size, order_column='id'):
+    '''
+    Return {table: frame} with the last limit_size rows (by order_column) of each table, in ascending order,
+    fetched in one round trip with UNION ALL. The tables must share the same columns, as the per-symbol tables do.
+
+    If the combined query fails (a table is missing or its columns changed), every table is queried on its own
+    and the tables that still fail are left out of the result, so they don't take the others down with them.
+    '''
+    tables = list(dict.fromkeys(tables))
+    for table in tables:
+        if not TABLE_NAME_PATTERN.match(table):
+            raise ValueError(f"Invalid table name: {table}")
+
+    try:
+        return query_last_rows(engine, tables, limit_size, order_column)
+    except QUERY_ERRORS as e:
+        log(f"Loading {len(tables)} tables in one query failed ({e!r}), loading them one at a time")
+
+    frames = {}
+    for table in tables:
+        try:
+            frames.update(query_last_rows(engine, [table], limit_size, order_column))
+        except QUERY_ERRORS as e:
+            log(f"Loading {table} failed: {e!r}")
+    return frames
+
+
+def query_last_rows(engine, tables, limit_size, order_column='id'):
+    # Every part is wrapped in a derived table so its ORDER BY/LIMIT applies before the union (MySQL and SQLite)
+    query = ' UNION ALL '.join(
+        f"SELECT * FROM (SELECT '{table}' AS source_table, T.* FROM `{table}` T ORDER BY T.`{order_column}` DESC LIMIT {int(limit_size)}) T{i}"
+        for i, table in enumerate(tables))
+    df = pd.read_sql(query, con=engine)
+
+    frames = {}
+    for table in tables:
+        rows = df[df['source_table'] == table].drop(columns='source_table')
+        frames[table] = rows.sort_values(order_column).reset_index(drop=True)
+    return frames
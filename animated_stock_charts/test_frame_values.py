@@ -0,0 +1,50 @@
+'''
+Check that precompute_frame_values() gives the same values as get_candlestick_frame_values() for every frame,
+including bars after the empty (all-NaN) bins the resampler keeps for halts and missing minutes.
+
+    python -m pytest test_frame_values.py
+'''
+import numpy as np
+import pandas as pd
+import pytest
+
+from main import get_candlestick_frame_values, precompute_frame_values, CANDLESTICK_RENDERERS
+
+
+def make_bars_with_gaps(count=40, gaps=(3, 4, 17), seed=0):
+    rng = np.random.default_rng(seed)
+    close = (100 + np.cumsum(rng.normal(0, 0.5, count))).round(2)
+    open_ = (close + rng.normal(0, 0.3, count)).round(2)
+    bars = pd.DataFrame({'open': open_, 'high': np.maximum(open_, close) + 0.25, 'low': np.minimum(open_, close) - 0.25, 'close': close},
+                        index=pd.date_range('2024-01-02 09:30', periods=count, freq='2min'))
+    bars.iloc[list(gaps)] = np.nan
+    return bars
+
+
+def assert_same_values(expected, actual):
+    assert expected.keys() == actual.keys()
+    for key, value in expected.items():
+        if isinstance(value, (float, np.floating)):
+            np.testing.assert_equal(float(actual[key]), float(value), err_msg=key)
+        else:
+            assert actual[key] == value, key
+
+
+@pytest.mark.parametrize('prev_close', [None, 98.5])
+def test_precomputed_values_match_every_prefix(prev_close):
+    bars = make_bars_with_gaps()
+    frame_values = precompute_frame_values(bars, prev_close)
+
+    for i in range(len(bars)):
+        assert_same_values(get_candlestick_frame_values(bars.iloc[:i + 1], prev_close), frame_values[i])
+
+
+@pytest.mark.parametrize('renderer', sorted(CANDLESTICK_RENDERERS))
+def test_renderers_draw_bars_after_a_gap(renderer, tmp_path):
+    bars = make_bars_with_gaps()
+    frame_renderer = CANDLESTICK_RENDERERS[renderer](bars, prev_close=98.5, chart_title='TEST Intraday Action', temp_dir=str(tmp_path))
+    try:
+        for i in range(len(bars)):
+            frame_renderer.render(i, i == len(bars) - 1, in_memory=True)
+    finally:
+        frame_renderer.close()
@@ -0,0 +1,57 @@
+'''
+Run blast_off_many() through RecordedDownloader and a BarStore against the small responses in recordings/: a
+batched 1m download of SPY and BAD in which BAD comes back empty, and the single-ticker retry for BAD.
+
+    python -m pytest test_yfinance_data.py
+'''
+import os
+
+import pytest
+
+from bar_store import BarStore
+from yfinance_data import RecordedDownloader, blast_off_many
+
+RECORDING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings')
+
+
+@pytest.fixture
+def downloader():
+    return RecordedDownloader(RECORDING_DIR)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BarStore(str(tmp_path / 'bars.sqlite'))
+
+
+def test_failed_ticker_is_retried_on_its_own(downloader):
+    data = blast_off_many(['SPY', 'BAD'], start_date='2024-01-02', downloader=downloader)
+
+    assert downloader.calls == [(['SPY', 'BAD'], '1m'), ('BAD', '1m')]
+    assert list(data['SPY'].columns) == ['datetime', 'symbol', 'open', 'high', 'low', 'close', 'volume']
+    assert len(data['SPY']) == 5
+    assert data['SPY']['volume'].dtype == 'int64'
+    assert data['BAD'].empty
+
+
+def test_fresh_bars_are_read_from_the_store(downloader, store):
+    first = blast_off_many(['SPY', 'BAD'], start_date='2024-01-02', downloader=downloader, store=store)
+    calls = len(downloader.calls)
+
+    second = blast_off_many(['SPY'], start_date='2024-01-02', downloader=downloader, store=store)
+
+    assert len(downloader.calls) == calls
+    assert second['SPY'].equals(first['SPY'])
+    assert second['SPY']['close'].tolist() == [472.16, 472.31, 472.05, 471.88, 472.02]
+
+
+def test_empty_ticker_is_downloaded_again(downloader, store):
+    blast_off_many(['SPY', 'BAD'], start_date='2024-01-02', downloader=downloader, store=store)
+    del downloader.calls[:]
+
+    data = blast_off_many(['SPY', 'BAD'], start_date='2024-01-02', downloader=downloader, store=store)
+
+    # The store has nothing for BAD, so only BAD is requested, and as the batch of one comes back empty it is retried
+    assert downloader.calls == [(['BAD'], '1m'), ('BAD', '1m')]
+    assert len(data['SPY']) == 5
+    assert data['BAD'].empty
@@ -3,17 +3,22 @@ import pandas as pd
 import datetime
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sql_data import PERIOD_LIMITS, get_engine, get_table_name, load_last_rows
 from sql_credentials import sqlalchemy_credentials
-from yfinance_data import blast_off
+from yfinance_data import blast_off, blast_off_many
+from bar_store import BarStore
+from resampling import resample_ohlc, resample_daily_ohlc
 import sqlite3
 from dotenv import load_dotenv
 import time
 import logging
 import platform
 import openai
-import pandas_market_calendars as mcal
-import numpy as np
+from market_sessions import is_session, get_previous_session
+
+
+# Downloaded bars are kept locally so re-runs and retries only download what is new
+BAR_STORE = BarStore('market_data/bars.sqlite')
 
 
 def log(msg):
@@ -31,23 +36,76 @@ def market_day(date, exchange='NYSE'):
         LSE, OSE,SIX, SSE,  TSX, BSE, TAS
     Return: Bool
     '''
-    # Return False for Saturdays and Sundays.
-    if date.weekday() > 4:
-        return False
-    date = np.datetime64(date.date())
-    ex = mcal.get_calendar(exchange)
-    holidays = ex.holidays()
-    return date not in holidays.holidays
+    # Sessions come from a per-process index of the exchange calendar (half days count as market days)
+    return is_session(date, exchange)
+
+
+def get_recent_close_start_date():
+    start_date = datetime.datetime.now() - datetime.timedelta(days=10)
+    return start_date.strftime('%Y-%m-%d')
+
+
+def build_prev_close_index(daily_data, date=None, days_back=1, exchange='NYSE'):
+    '''
+    Return {symbol: close} with every symbol's close on the session days_back sessions before the current one,
+    from daily bars as blast_off() returns them ({symbol: frame}). The session is found once from the exchange
+    calendar, so holidays and half days are handled and a daily bar for today that yfinance has not published
+    yet does not shift the result. A symbol without a bar on that session (halted) gets its last close before it.
+    '''
+    previous_session = get_previous_session(date, days_back, exchange)
+
+    prev_closes = {}
+    for symbol, df in daily_data.items():
+        dates = pd.DatetimeIndex(df['datetime'])
+        dates = (dates.tz_localize(None) if dates.tz is not None else dates).normalize()
+        closes = df['close'][dates <= previous_session]
+        if closes.empty:
+            log(f"No daily close for {symbol} on or before {previous_session.date()}")
+            continue
+        if dates[dates <= previous_session][-1] != previous_session:
+            log(f"No daily bar for {symbol} on {previous_session.date()}, using the close of {dates[dates <= previous_session][-1].date()}")
+        prev_closes[symbol] = closes.iloc[-1]
+
+    return prev_closes
 
 
+def get_recent_daily_data(symbols, downloader=None, store=BAR_STORE):
+    # The last 10 days of daily bars of all symbols, in one batched request
+    return blast_off_many(symbols, interval='1d', start_date=get_recent_close_start_date(), downloader=downloader, store=store)
 
-def get_most_recent_close(symbol, days_back=0):
+
+def get_prev_closes(symbols, downloader=None, store=BAR_STORE):
+    '''Return {symbol: previous session's close} for all symbols from one batched daily download.'''
+    return build_prev_close_index(get_recent_daily_data(symbols, downloader=downloader, store=store))
+
+
+def get_intraday_market_data(symbols, downloader=None, store=BAR_STORE):
+    '''
+    Download today's 1m bars and the last 10 days of daily bars for all symbols in two batched yfinance
+    requests instead of two per symbol, and look up every symbol's previous close once from the daily bars.
+    Returns {symbol: {'1m': frame, '1d': frame, 'prev_close': close}} with the frames blast_off() returns,
+    to hand to get_stock_data_to_plot() and get_most_recent_close().
+    '''
+    log(f"Downloading market data for {len(symbols)} symbols")
+    intraday_data = blast_off_many(symbols, interval='1m', downloader=downloader, store=store)
+    daily_data = get_recent_daily_data(symbols, downloader=downloader, store=store)
+    prev_closes = build_prev_close_index(daily_data)
+    log("Retrieved market data from yfinance")
+
+    return {symbol: {'1m': intraday_data[symbol], '1d': daily_data[symbol], 'prev_close': prev_closes.get(symbol)} for symbol in symbols}
+
+
+def get_most_recent_close(symbol, days_back=0, market_data=None):
+    # days_back counts exchange sessions back from the most recent one: 1 is the previous session's close
 
     log("Starting to get most recent close")
-    now = datetime.datetime.now()
-    start_date = now - datetime.timedelta(days=10)
-    start_date = start_date.strftime('%Y-%m-%d')
-    df = blast_off(stock_symbol=symbol, specific_date_to_process=None, interval='1d', start_date=start_date)  # '2023-10-20'
+    if market_data is not None and days_back == 1 and market_data.get('prev_close') is not None:
+        return market_data['prev_close']
+
+    if market_data is not None:
+        df = market_data['1d']
+    else:
+        df = blast_off(stock_symbol=symbol, specific_date_to_process=None, interval='1d', start_date=get_recent_close_start_date(), store=BAR_STORE)  # '2023-10-20'
     log("Retrieved stock daily close from yfinance")
 
     '''
@@ -69,43 +127,58 @@ def get_most_recent_close(symbol, days_back=0):
     return df['close'].iloc[days_back]
     '''
 
-    return df['close'].iloc[-2]
+    return build_prev_close_index({symbol: df}, days_back=days_back)[symbol]
 
 
-def get_stock_data_to_plot(symbol, only_get_most_recent_day=True, period_to_chart=None, use_yfinance_data=None):
+def get_stock_data_to_plot(symbol, only_get_most_recent_day=True, period_to_chart=None, use_yfinance_data=None, market_data=None):
     log("Getting stock data to plot")
 
     if period_to_chart == '1m' and use_yfinance_data:
-        df = blast_off(stock_symbol=symbol, specific_date_to_process=None)  # '2023-10-20'
+        if market_data is not None:
+            df = market_data['1m']
+        else:
+            df = blast_off(stock_symbol=symbol, specific_date_to_process=None, store=BAR_STORE)  # '2023-10-20'
         df = df[["datetime", "open", "high", "low", "close"]]
         log("Retrieved stock data to plot from yfinance")
 
         df = create_new_stock_timeframe(df, output_mins_timeframe=2)
 
-        # Replace df index to reset the index timezone correctly
-        df['datetime2'] = df['datetime'].astype('str')
-        df['datetime2'] = df['datetime2'].str[:-6]
-        df['datetime2'] = pd.to_datetime(df['datetime2'])
-        df.set_index('datetime2', inplace=True)
+        # Index the bars by exchange wall time, which is what the charts are labelled with
+        df.index = pd.DatetimeIndex(df['datetime']).tz_localize(None).rename('datetime2')
 
         return df
 
-    DB_CONNECTION_STRING = sqlalchemy_credentials(period_to_chart)
-    engine = create_engine(DB_CONNECTION_STRING, pool_recycle=1)
+    if market_data is not None and period_to_chart in market_data:
+        df = market_data[period_to_chart].copy()
+    else:
+        DB_CONNECTION_STRING = sqlalchemy_credentials(period_to_chart)
+        engine = get_engine(DB_CONNECTION_STRING)
+        limit_size = PERIOD_LIMITS[period_to_chart]
+        table = get_table_name(symbol, period_to_chart)
 
-    if period_to_chart == '1m':
-        limit_size = 500
-    elif period_to_chart == 'quarter':
-        limit_size = 65
-    elif period_to_chart == 'six_months':
-        limit_size = 127
-    elif period_to_chart == 'year':
-        limit_size = 253
+        df = pd.read_sql(f'SELECT * FROM (SELECT * FROM `{table}` ORDER BY id DESC LIMIT {limit_size}) T1 ORDER BY id ASC', con=engine)
+
+    df = prepare_sql_bars(df, period_to_chart, only_get_most_recent_day)
+
+    log("Retrieved stock data to plot from SQL database")
+    return df
 
-    table = f"{symbol}_1m_data" if period_to_chart == '1m' else f"{symbol}_daily"
 
-    df = pd.read_sql(f'SELECT * FROM (SELECT * FROM `{table}` ORDER BY id DESC LIMIT {limit_size}) T1 ORDER BY id ASC', con=engine)
+def get_sql_market_data(symbols, period_to_chart, engine=None):
+    '''
+    Load the rows get_stock_data_to_plot() charts for period_to_chart for all symbols in one query.
+    Returns {symbol: {period_to_chart: frame}} to hand to get_stock_data_to_plot() as market_data.
+    Symbols whose table could not be loaded are left out.
+    '''
+    engine = engine or get_engine(sqlalchemy_credentials(period_to_chart))
+    tables = {symbol: get_table_name(symbol, period_to_chart) for symbol in symbols}
+    frames = load_last_rows(engine, tables.values(), PERIOD_LIMITS[period_to_chart])
+    log(f"Retrieved {period_to_chart} data for {len(frames)} of {len(symbols)} symbols from SQL database")
 
+    return {symbol: {period_to_chart: frames[table]} for symbol, table in tables.items() if table in frames}
+
+
+def prepare_sql_bars(df, period_to_chart, only_get_most_recent_day=True):
     if 'date' in df.columns:
         df['datetime'] = pd.to_datetime(df['date'])
     elif 'datetime' in df.columns:
@@ -125,58 +198,17 @@ def get_stock_data_to_plot(symbol, only_get_most_recent_day=True, period_to_char
     # elif period_to_chart == 'year':
     #     df = create_new_stock_timeframe(df, output_mins_timeframe=2, resample_daily_data=True)
 
-    log("Retrieved stock data to plot from SQL database")
     return df
 
 
 def create_new_stock_timeframe(input_dataframe, output_mins_timeframe=30, resample_daily_data=False):
-    # Resampled data will be appended to the new dataframe.
-    new_dataframe = pd.DataFrame(columns=input_dataframe.columns)
-
-    # We need to set the index of the input dataframe to datetime in
-    # order to resample it.
-    datetime_index = pd.to_datetime(input_dataframe['datetime'])
-    input_dataframe.set_index(datetime_index, inplace=True)
-
-    # Convert the output_timeframe into string representation.
+    # Daily data is resampled into N-day bars with weekend bars moved to Monday. Intraday data is resampled
+    # into N-minute bars per day, starting at each day's first bar so the bars match the market hours.
+    # Both build every bar in one vectorized pass (see resampling.py).
     if resample_daily_data:
-        string_timeframe = '{}D'.format(output_mins_timeframe)
-    else:
-        string_timeframe = '{}min'.format(output_mins_timeframe)
-
-    # The resample rule is a dictionary that specifies the aggregation method
-    # used for different columns in the input dataframe.
-    resample_rules = {
-        'open': 'first',
-        'high': max,
-        'low': min,
-        'close': 'last',
-        # 'volume': sum  # Uncomment if your data has a volume column
-    }
-
-    # Check if we are resampling daily data or not
-    if resample_daily_data:
-        # Resample the entire dataframe without per-day grouping.
-        resampled = input_dataframe.resample(rule=string_timeframe).apply(resample_rules)
+        return resample_daily_ohlc(input_dataframe, days=output_mins_timeframe)
 
-        # Shift Saturdays and Sundays to the next Monday.
-        resampled.index += pd.to_timedelta((resampled.index.weekday == 5) * 2, unit='D')  # Saturdays
-        resampled.index += pd.to_timedelta((resampled.index.weekday == 6) * 1, unit='D')  # Sundays
-
-        new_dataframe = new_dataframe.append(resampled)
-    else:
-        # Group the data by days and perform resampling to each day individually.
-        # This will ensure that the results match the market hours.
-        for date_index, date_group in input_dataframe.groupby(pd.Grouper(freq='D')):
-            resampled = date_group.resample(
-                rule=string_timeframe,
-                origin='start').apply(resample_rules)
-            new_dataframe = new_dataframe.append(resampled)
-
-    # Set the new datetime column to the index of the new dataframe.
-    new_dataframe['datetime'] = new_dataframe.index
-
-    return new_dataframe
+    return resample_ohlc(input_dataframe, f'{output_mins_timeframe}min')
 
 
 def create_animated_text_videos_db():
@@ -0,0 +1,324 @@
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+
+def resize_frame(img, target_size=(1080, 1080)):
+    return img.resize(target_size, Image.LANCZOS) if platform.system() == "Linux" else img.resize(target_size, Image.ANTIALIAS)
+
+
+def pad_frame(img, target_size=(1080, 1080)):
+    # Centre img on a white canvas of target_size
+    width, height = target_size
+    canvas = Image.new('RGB', target_size, 'white')
+    canvas.paste(img, ((width - img.width) // 2, (height - img.height) // 2))
+    return canvas
+
+
+def fit_frame(img, target_size=(1080, 1080)):
+    '''
+    Fit a chart or intro image to target_size: scaled (keeping its aspect ratio) to fit a square as large as
+    the shorter side of target_size, then centred on a white canvas. Charts rendered at that side, which may
+    come out a pixel or two short of it, are only padded.
+    '''
+    img = img.convert('RGB')
+    if img.size == tuple(target_size):
+        return img
+
+    side = min(target_size)
+    if not (img.width <= side and img.height <= side and max(img.size) >= side - 2):
+        scale = side / max(img.size)
+        img = resize_frame(img, (max(1, round(img.width * scale)), max(1, round(img.height * scale))))
+
+    return img if img.size == tuple(target_size) else pad_frame(img, target_size)
+
+
+def load_frame(image, frame_size=None):
+    '''Return a timeline image (file path or array) as a contiguous RGB uint8 array, fitted to frame_size if given.'''
+    if isinstance(image, str):
+        with Image.open(image) as img:
+            return np.asarray(fit_frame(img, frame_size) if frame_size else img.convert('RGB'))
+
+    frame = np.ascontiguousarray(image[:, :, :3], dtype=np.uint8)
+    if frame_size and frame.shape[1::-1] != tuple(frame_size):
+        return np.asarray(fit_frame(Image.fromarray(frame), frame_size))
+    return frame
+
+
+def get_entry_ends(durations):
+    # Entry boundaries and sample times are compared at nanosecond precision, so a boundary that falls exactly
+    # on an output frame is resolved the same way however the durations were split or summed
+    return np.round(np.cumsum(durations), 9)
+
+
+def get_sample_times(duration, fps=24):
+    # One output frame every 1/fps seconds from t=0 up to (but excluding) the end of the timeline
+    frame_count = int(np.ceil(np.round(duration * fps, 6)))
+    return np.round(np.arange(frame_count) / fps, 9)
+
+
+def merge_identical_entries(timeline):
+    '''
+    Merge runs of consecutive timeline entries that show the same image into one longer entry.
+
+    Images are the same when they are the same file or the same array, e.g. a frame index scheduled more than once,
+    which render_candlestick_images() renders once. Pixels are not compared: every chart frame adds a candle, so
+    distinct frames practically never match. Entries with a fade-out are never merged, so the fade timing doesn't
+    change, and the merged entry covers exactly the same time span, so every output frame stays the same.
+    '''
+    merged = []
+    previous_image = None
+
+    for image, duration, fadeout_duration in timeline:
+        same_image = image is previous_image or (isinstance(image, str) and image == previous_image)
+        if same_image and not fadeout_duration and not merged[-1][2]:
+            merged_image, merged_duration, _ = merged[-1]
+            merged[-1] = (merged_image, merged_duration + duration, 0)
+        else:
+            merged.append((image, duration, fadeout_duration))
+        previous_image = image
+
+    return merged
+
+
+def get_timeline_duration(timeline):
+    return sum(duration for _, duration, _ in timeline)
+
+
+def get_frame_schedule(timeline, fps=24):
+    '''
+    Return the timeline entry index and the fade factor (1.0 outside fade-outs) of every output frame.
+
+    The timeline is a list of (image, duration, fadeout_duration) entries played back to back, the same
+    way concatenate_videoclips() lays out ImageClips. Fade factors follow moviepy's fadeout() formula.
+    '''
+    durations = np.array([duration for _, duration, _ in timeline], dtype=float)
+    fadeout_durations = np.array([fadeout_duration for _, _, fadeout_duration in timeline], dtype=float)
+    ends = get_entry_ends(durations)
+    starts = ends - durations
+
+    sample_times = get_sample_times(np.cumsum(durations)[-1], fps=fps)
+    entry_indices = np.minimum(np.searchsorted(ends, sample_times, side='right'), len(timeline) - 1)
+
+    time_left = durations[entry_indices] - (sample_times - starts[entry_indices])
+    frame_fadeouts = fadeout_durations[entry_indices]
+    fading = np.ones(len(sample_times))
+    in_fadeout = (frame_fadeouts > 0) & (time_left < frame_fadeouts)
+    fading[in_fadeout] = 1.0 * time_left[in_fadeout] / frame_fadeouts[in_fadeout]
+
+    return entry_indices, fading
+
+
+def iter_scheduled_frames(images, entry_indices, fading, frame_size=None):
+    # Each image is decoded (and fitted to frame_size) once and its bytes are repeated for every output frame
+    # it covers; only the frames inside a fade-out are recomputed
+    loaded_index = None
+    frame = None
+    frame_bytes = None
+
+    for entry_index, frame_fading in zip(entry_indices, fading):
+        if loaded_index != entry_index:
+            frame = load_frame(images[entry_index], frame_size)
+            frame_bytes = frame.tobytes()
+            loaded_index = entry_index
+
+        if frame_fading < 1:
+            yield (frame_fading * frame).astype('uint8').tobytes()
+        else:
+            yield frame_bytes
+
+
+def iter_output_frames(timeline, fps=24, frame_size=None):
+    '''Yield the raw rgb24 bytes of every output frame of the timeline.'''
+    entry_indices, fading = get_frame_schedule(timeline, fps=fps)
+    yield from iter_scheduled_frames([image for image, _, _ in timeline], entry_indices, fading, frame_size)
+
+
+def get_visible_entries(durations, fps=24):
+    '''
+    Return (entry index, duration) for every timeline entry that is shown in at least one output frame.
+
+    Output frames are sampled at t = 0, 1/fps, 2/fps, ... like iter_output_frames() does. An entry that
+    falls entirely between two samples is never shown; its time is handed to the next visible entry,
+    which starts earlier instead, so the encoded frames stay exactly the same. The last entry is always
+    kept so the timeline length doesn't change.
+    '''
+    ends = get_entry_ends(durations)
+    sample_times = get_sample_times(np.cumsum(durations)[-1], fps=fps)
+    shown = np.minimum(np.searchsorted(ends, sample_times, side='right'), len(durations) - 1)
+
+    visible = np.zeros(len(durations), dtype=bool)
+    visible[shown] = True
+    visible[-1] = True
+
+    entries = []
+    previous_end = 0.0
+    for index in np.flatnonzero(visible):
+        entries.append((int(index), float(ends[index] - previous_end)))
+        previous_end = ends[index]
+
+    return entries
+
+
+def get_audio_duration(audio_file):
+    return ffmpeg_parse_infos(audio_file)['duration']
+
+
+def get_raw_video_input_args(width, height, fps):
+    return [
+        get_setting("FFMPEG_BINARY"),
+        '-y',
+        '-loglevel', 'error',
+        '-f', 'rawvideo',
+        '-vcodec', 'rawvideo',
+        '-s', f'{width}x{height}',
+        '-pix_fmt', 'rgb24',
+        '-r', f'{fps:.02f}',
+        '-i', '-',
+    ]
+
+
+def get_audio_args(audio_file, duration, audio_fadeout_duration=1.5, audio_codec='libmp3lame', audio_input=1):
+    # Raises OSError if the audio is shorter than the video rather than writing a video whose audio stops early
+    audio_duration = get_audio_duration(audio_file)
+    if audio_duration < duration:
+        raise OSError(f"Audio file {audio_file} ({audio_duration}s) is shorter than the video ({duration}s)")
+
+    # The audio is trimmed to the video length here; the output is not cut with -t, which would drop the last
+    # video frame whenever the timeline ends part-way through it
+    audio_filters = [f'atrim=end={duration:.6f}']
+    if audio_fadeout_duration:
+        fadeout_start = max(0, duration - audio_fadeout_duration)
+        audio_filters.append(f'afade=t=out:st={fadeout_start:.3f}:d={audio_fadeout_duration}')
+
+    args = [
+        '-i', audio_file,
+        '-map', '0:v:0',
+        '-map', f'{audio_input}:a:0',
+        '-af', ','.join(audio_filters),
+        '-acodec', audio_codec,
+    ]
+
+    return args
+
+
+def pipe_frames_to_ffmpeg(cmd, frames, video_filename):
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    try:
+        for frame_bytes in frames:
+            proc.stdin.write(frame_bytes)
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+
+    error = proc.stderr.read().decode('utf-8', errors='replace')
+    proc.wait()
+
+    if proc.returncode != 0:
+        raise OSError(f"ffmpeg failed to write {video_filename}: {error}")
+
+    return video_filename
+
+
+def write_video_with_ffmpeg(timeline, video_filename, audio_file=None, fps=24, audio_fadeout_duration=1.5, frame_size=None,
+                            codec='libx264', preset='medium', audio_codec='libmp3lame'):
+    '''
+    Encode the timeline by piping raw frames straight into one ffmpeg process.
+
+    The audio track is trimmed to the timeline length, faded out over the last audio_fadeout_duration
+    seconds and muxed in the same ffmpeg pass. Codec, preset and pixel format match what moviepy's
+    write_videofile() uses for .mp4 files. Raises OSError if the audio is shorter than the video.
+    With frame_size every image is fitted to it (see fit_frame()) as it is encoded.
+    '''
+    width, height = frame_size or load_frame(timeline[0][0]).shape[1::-1]
+    duration = get_timeline_duration(timeline)
+
+    cmd = get_raw_video_input_args(width, height, fps)
+    if audio_file:
+        cmd.extend(get_audio_args(audio_file, duration, audio_fadeout_duration, audio_codec))
+
+    cmd.extend([
+        '-vcodec', codec,
+        '-preset', preset,
+        '-pix_fmt', 'yuv420p',
+        video_filename,
+    ])
+
+    return pipe_frames_to_ffmpeg(cmd, iter_output_frames(timeline, fps=fps, frame_size=frame_size), video_filename)
+
+
+def encode_segment(images, entry_indices, fading, segment_filename, width, height, fps=24, gop_size=240,
+                   codec='libx264', preset='medium'):
+    '''Encode one video-only segment from the images and per-frame schedule handed over by write_video_in_segments().'''
+    cmd = get_raw_video_input_args(width, height, fps)
+    cmd.extend([
+        '-vcodec', codec,
+        '-preset', preset,
+        '-g', str(gop_size),
+        '-pix_fmt', 'yuv420p',
+        segment_filename,
+    ])
+
+    return pipe_frames_to_ffmpeg(cmd, iter_scheduled_frames(images, entry_indices, fading, (width, height)), segment_filename)
+
+
+def write_video_in_segments(timeline, video_filename, audio_file=None, fps=24, audio_fadeout_duration=1.5, frame_size=None, workers=None,
+                            gop_size=240, codec='libx264', preset='medium', audio_codec='libmp3lame'):
+    '''
+    Encode the timeline as GOP-aligned video segments in parallel processes and join them without re-encoding.
+
+    Every segment is a whole number of gop_size frames (except the last one) and starts on a keyframe, so
+    the segments can be concatenated with ffmpeg's concat demuxer and stream copy. The faded audio track is
+    muxed once, in the concatenation pass. Each worker only receives the images its frames show.
+    Codec, preset, pixel format and frame_size are the same as write_video_with_ffmpeg().
+    '''
+    width, height = frame_size or load_frame(timeline[0][0]).shape[1::-1]
+    duration = get_timeline_duration(timeline)
+    audio_args = get_audio_args(audio_file, duration, audio_fadeout_duration, audio_codec) if audio_file else []
+
+    entry_indices, fading = get_frame_schedule(timeline, fps=fps)
+    workers = workers or os.cpu_count() or 1
+    gops = -(-len(entry_indices) // gop_size)
+    segment_length = max(1, -(-gops // workers)) * gop_size
+
+    segment_dir = tempfile.mkdtemp(prefix='segments_')
+    try:
+        segment_filenames = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            jobs = []
+            for start in range(0, len(entry_indices), segment_length):
+                segment_entries = entry_indices[start:start + segment_length]
+                used_entries = np.unique(segment_entries)
+                images = [timeline[index][0] for index in used_entries]
+                segment_filename = os.path.join(segment_dir, f"segment_{len(segment_filenames):04d}.mp4")
+                segment_filenames.append(segment_filename)
+                jobs.append(executor.submit(encode_segment, images, np.searchsorted(used_entries, segment_entries),
+                                            fading[start:start + segment_length], segment_filename, width, height,
+                                            fps=fps, gop_size=gop_size, codec=codec, preset=preset))
+
+            for job in jobs:
+                job.result()
+
+        concat_list = os.path.join(segment_dir, 'segments.txt')
+        with open(concat_list, 'w') as f:
+            f.writelines(f"file '{os.path.abspath(filename)}'\n" for filename in segment_filenames)
+
+        cmd = [get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', concat_list]
+        cmd.extend(audio_args)
+        cmd.extend(['-vcodec', 'copy', '-movflags', '+faststart', video_filename])
+
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise OSError(f"ffmpeg failed to write {video_filename}: {result.stderr.decode('utf-8', errors='replace')}")
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+    return video_filename
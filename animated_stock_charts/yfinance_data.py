@@ -1,7 +1,12 @@
+import os
+import hashlib
+import pickle
+import tempfile
 import pandas as pd
 import yfinance as yf
 from datetime import datetime
 from time import sleep, time
+from market_sessions import drop_bars_after_close
 
 
 def log(msg):
@@ -9,7 +14,11 @@ def log(msg):
     print(f'\n{datetime.now()} {msg}')
 
 
-def blast_off(stock_symbol, specific_date_to_process=None, interval="1m", start_date=None):
+def blast_off(stock_symbol, specific_date_to_process=None, interval="1m", start_date=None, store=None):
+    # With a BarStore, bars are read from the store and only the ones it is missing are downloaded
+    if store is not None:
+        return blast_off_many([stock_symbol], specific_date_to_process, interval, start_date, store=store)[stock_symbol]
+
     now = datetime.now()
     today = now.date().strftime('%Y-%m-%d')
     today = today if not specific_date_to_process else specific_date_to_process
@@ -19,6 +28,10 @@ def blast_off(stock_symbol, specific_date_to_process=None, interval="1m", start_
         starting_date = start_date
     data = yf.download(f"{stock_symbol}", start=starting_date, interval=interval)
 
+    return format_symbol_data(data, stock_symbol, interval)
+
+
+def format_symbol_data(data, stock_symbol, interval="1m"):
     # Using rename can be tasking when renaming a large number of columns.
     # I have included an easier way below
     # data.rename(columns={'Open': 'open', 'Close': 'close', 'Low': 'low', 'High': 'high', 'Volume': 'volume', 'Datetime': 'datetime'}, inplace=True)
@@ -50,8 +63,12 @@ def blast_off(stock_symbol, specific_date_to_process=None, interval="1m", start_
     # you may always call in dataframe.columns to refer to their current names and mind the order of which they appear.
     print(data.columns)
 
-    # Then assign the names you want in the order which they appear. (this is why it is important to mind their order.)
-    data.columns = ['open', 'high', 'low', 'close', 'adj close', 'volume']
+    # Then assign the names you want. They are matched by name rather than by the order they appear in, because
+    # batched downloads and newer yfinance versions order them differently (and may leave out 'Adj Close')
+    if isinstance(data.columns, pd.MultiIndex):
+        # Newer yfinance versions add a ticker level even for a single symbol
+        data.columns = data.columns.get_level_values(0)
+    data.columns = [column.lower() for column in data.columns]
 
     # renaming the index is also as such. If you have more than one index, mid the order as well just like in the case...
     # of the columns
@@ -65,17 +82,16 @@ def blast_off(stock_symbol, specific_date_to_process=None, interval="1m", start_
     # you may also rearange the order of which you wish to have them appear. Do not include the index name because it...
     # is not regarded as a column. Also, keep in mind the index is always on the left most handside, just like the..
     # row numbers in excel
-    data = data[['datetime', 'symbol', 'open', 'high', 'low', 'close', 'adj close', 'volume']]
+    data = data[['datetime', 'symbol', 'open', 'high', 'low', 'close', 'volume']]
 
     data['close'] = data['close'].round(2)
 
-    del data['adj close']
-
     data = data.drop_duplicates()
 
-    # yfinance strangely gives a row of bad data for 16:00, this removes it
+    # yfinance strangely gives a row of bad data at the close (16:00, or earlier on half days), this removes it
     data['datetime'] = pd.to_datetime(data['datetime'])
-    data = data[data['datetime'].dt.hour < 16]
+    if is_intraday_interval(interval):
+        data = drop_bars_after_close(data)
 
     print(data.tail(n=15))
     print('\n')
@@ -84,6 +100,119 @@ def blast_off(stock_symbol, specific_date_to_process=None, interval="1m", start_
     return data
 
 
+def is_intraday_interval(interval):
+    return interval.endswith(('m', 'h')) and not interval.endswith('mo')
+
+
+def get_download_start(specific_date_to_process=None, start_date=None):
+    if start_date:
+        return start_date
+    return specific_date_to_process or datetime.now().date().strftime('%Y-%m-%d')
+
+
+def split_batch_download(data, symbols):
+    '''
+    Split a multi-symbol yf.download() result (columns grouped by ticker) into one frame per symbol with the
+    columns of a single-symbol download. Rows where a symbol has no data, which a batch contains wherever the
+    other symbols traded, are dropped.
+    '''
+    if not isinstance(data.columns, pd.MultiIndex):
+        # A single ticker comes back without the ticker level
+        return {symbols[0]: data}
+
+    tickers = data.columns.get_level_values(0)
+    frames = {}
+    for symbol in symbols:
+        if symbol not in tickers:
+            continue
+        frame = data[symbol].dropna(how='all')
+        # The gaps of the combined index turn volumes into floats, single downloads have integer volumes
+        if 'Volume' in frame.columns and not frame.empty and frame['Volume'].notna().all():
+            frame = frame.astype({'Volume': 'int64'})
+        frames[symbol] = frame
+    return frames
+
+
+def blast_off_many(stock_symbols, specific_date_to_process=None, interval="1m", start_date=None, downloader=None, store=None):
+    '''
+    Download `interval` bars for all stock_symbols in one batched request and return {symbol: frame}, each
+    frame formatted exactly as blast_off() returns it. Symbols missing from the batch (a failed ticker comes
+    back empty) are retried one at a time.
+
+    With a BarStore, symbols whose stored bars are fresh are not downloaded at all, the others are downloaded
+    in one batch from the earliest date any of them needs, and every frame is read back from the store.
+
+    downloader defaults to yf.download; pass a RecordedDownloader to run without network access.
+    '''
+    downloader = downloader or yf.download
+    stock_symbols = list(stock_symbols)
+    starting_date = get_download_start(specific_date_to_process, start_date)
+
+    download_starts = {symbol: starting_date for symbol in stock_symbols}
+    if store is not None:
+        download_starts = {symbol: store.plan_download(symbol, interval, starting_date) for symbol in stock_symbols}
+        download_starts = {symbol: start for symbol, start in download_starts.items() if start is not None}
+
+    symbol_data = {}
+    if download_starts:
+        symbols_to_download = list(download_starts)
+        download_start = min(download_starts.values())
+        data = downloader(symbols_to_download, start=download_start, interval=interval, group_by='ticker', threads=True, progress=False)
+        frames = split_batch_download(data, symbols_to_download)
+
+        for symbol in symbols_to_download:
+            frame = frames.get(symbol)
+            if frame is None or frame.empty:
+                log(f"{symbol} missing from the batched {interval} download, downloading it on its own")
+                frame = downloader(symbol, start=download_start, interval=interval, progress=False)
+            symbol_data[symbol] = format_symbol_data(frame.copy(), symbol, interval)
+            if store is not None:
+                store.ingest(symbol, interval, symbol_data[symbol], download_start)
+
+    if store is not None:
+        symbol_data = {symbol: store.read(symbol, interval, starting_date) for symbol in stock_symbols}
+
+    return symbol_data
+
+
+class RecordedDownloader:
+    '''
+    Stand-in for yf.download() that replays responses recorded on disk, so the batched download layer can run
+    offline. With record=True every call goes to yf.download() and its response is saved first.
+
+    Responses are keyed by the requested tickers and interval only, so a recording made on one day replays for
+    any start date.
+    '''
+
+    def __init__(self, recording_dir, record=False):
+        self.recording_dir = recording_dir
+        self.record = record
+        self.calls = []
+
+    def path_for(self, tickers, interval):
+        tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+        key = hashlib.sha1(','.join(tickers).encode()).hexdigest()[:16]
+        return os.path.join(self.recording_dir, f"{interval}_{key}.pkl")
+
+    def __call__(self, tickers, interval="1d", **kwargs):
+        self.calls.append((tickers, interval))
+        path = self.path_for(tickers, interval)
+
+        if self.record:
+            data = yf.download(tickers, interval=interval, **kwargs)
+            os.makedirs(self.recording_dir, exist_ok=True)
+            fd, tmp_filename = tempfile.mkstemp(suffix='.pkl', dir=self.recording_dir)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f)
+            os.replace(tmp_filename, path)
+            return data
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No recorded {interval} response for {tickers} in {self.recording_dir}")
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
 if __name__ == '__main__':
     symbols_to_loop = ['SPY']
 